@@ -1,3 +1,4 @@
+from __future__ import annotations
 
 from typing import Optional, Iterable
 
@@ -9,40 +10,98 @@ subparsers = parser.add_subparsers(description=None, dest='subparser_name')
 subparser_run = subparsers.add_parser('run', help="run the bot", formatter_class=Formatter)
 subparser_run.add_argument('--debug', action='store_true', help="enable debug level logging")
 subparser_create_database = subparsers.add_parser('create_database', help="create the database", formatter_class=Formatter)
+subparser_migrate_database = subparsers.add_parser('migrate_database', help="add any missing columns and indexes to an existing database", formatter_class=Formatter)
 subparser_show_config = subparsers.add_parser('show_config', help="display configuration values to help verify that the configuration file can be found", formatter_class=Formatter)
 subparser_test_one = subparsers.add_parser('test_one', help="display the generated message for a single submission", formatter_class=Formatter)
 subparser_test_one.add_argument('target', help="the ID36 of a submission")
 subparser_test_many = subparsers.add_parser('test_many', help="display which submissions from the current new listing would be commented on", formatter_class=Formatter)
 subparser_test_many.add_argument('-n', type=int, default=100, help="the number of submissions to check")
+subparser_test_many.add_argument('-j', '--workers', type=int, default=None, help="the number of worker processes to use for feature extraction (default: CPU count)")
 subparser_test_string = subparsers.add_parser('test_string', help="display the generated message given a test string", formatter_class=Formatter)
 subparser_test_string.add_argument('text')
+subparser_test_string.add_argument('--engine', default='registry', choices=('registry', 'registry_unfiltered', 'line_scan'), help="the feature extraction engine to use")
+subparser_test_engines = subparsers.add_parser('test_engines', help="check that every feature extraction engine agrees on a generated corpus", formatter_class=Formatter)
+subparser_test_engines.add_argument('-n', type=int, default=10000, help="the number of texts to generate")
+subparser_test_engines.add_argument('--seed', type=int, default=0, help="the random seed for the corpus generator")
+subparser_test_query_plans = subparsers.add_parser('test_query_plans', help="check that the bot's database queries use their indexes on SQLite", formatter_class=Formatter)
+subparser_test_query_plans.add_argument('-n', type=int, default=5000, help="the number of records to fill the test database with")
+subparser_test_stream_resumption = subparsers.add_parser('test_stream_resumption', help="check that the stream checkpoints survive restarts during a catch-up", formatter_class=Formatter)
+subparser_benchmark_matcher = subparsers.add_parser('benchmark_matcher', help="time the backtracking and linear code detection matchers on adversarial inputs", formatter_class=Formatter)
+subparser_benchmark_matcher.add_argument('sizes', type=int, nargs='*', default=[1000, 2000, 4000, 8000, 16000, 40000], help="the input sizes in characters")
+subparser_benchmark_matcher.add_argument('--give-up-after', type=float, default=1., help="stop timing the backtracking matcher on an input once it takes this many seconds")
+subparser_benchmark = subparsers.add_parser('benchmark', help="time the feature detectors, extraction engines and message pipeline on a generated corpus", formatter_class=Formatter)
+subparser_benchmark.add_argument('-n', type=int, default=200, help="the number of texts to generate per corpus category")
+subparser_benchmark.add_argument('--seed', type=int, default=0, help="the random seed for the corpus generator")
+subparser_benchmark.add_argument('--repeat', type=int, default=5, help="the number of runs to take the best time of")
+subparser_benchmark.add_argument('-o', '--output', default=None, help="write the JSON results to this file instead of stdout")
+subparser_compare_benchmarks = subparsers.add_parser('compare_benchmarks', help="compare two JSON benchmark results and flag regressions", formatter_class=Formatter)
+subparser_compare_benchmarks.add_argument('old', help="the baseline results file")
+subparser_compare_benchmarks.add_argument('new', help="the results file to check")
+subparser_compare_benchmarks.add_argument('--threshold', type=float, default=.1, help="the slowdown ratio over which a timing counts as a regression")
+subparser_benchmark_records = subparsers.add_parser('benchmark_records', help="time loading recheck records from result rows and measure their memory use", formatter_class=Formatter)
+subparser_benchmark_records.add_argument('sizes', type=int, nargs='*', default=[100000, 1000000], help="the numbers of records to load")
+subparser_benchmark_records.add_argument('--repeat', type=int, default=3, help="the number of runs to take the best time of")
+subparser_benchmark_startup = subparsers.add_parser('benchmark_startup', help="measure the import time of each sub-command in a fresh interpreter", formatter_class=Formatter)
+subparser_benchmark_startup.add_argument('subcommand', nargs='?', default=None, help="only measure this sub-command")
+subparser_benchmark_startup.add_argument('--repeat', type=int, default=5, help="the number of runs to take the best time of")
+subparser_benchmark_startup.add_argument('--top', type=int, default=0, help="also list this many modules with the highest self import time")
 subparser_test_string = subparsers.add_parser('process_targets', help="Process submissions individually. Only add the submission to the database if it is not OK.", formatter_class=Formatter)
 subparser_test_string.add_argument('submission_id36', nargs='+')
+subparser_test_string.add_argument('-j', '--workers', type=int, default=None, help="the number of worker processes to use for feature extraction (default: CPU count)")
 args = parser.parse_args()
 ###;
 
+# Each sub-command imports only what it needs so that startup stays fast.
+# See the `benchmark_startup` sub-command.
+
 import sys
 from configparser import ConfigParser
-import asyncio
-
-import redditwarp.http.transport.connectors.httpx  # noqa: F401
-from sqlalchemy.ext.asyncio import create_async_engine as create_engine
-
-from .database_schema import create_database_async
-from . import programs
 
 
 subparser_name: Optional[str] = args.subparser_name
 if subparser_name == 'run':
+    import redditwarp.http.transport.connectors.httpx  # noqa: F401
+    from .programs import bot
     debug: bool = args.debug
-    programs.bot.run_invoke(debug=debug)
+    bot.run_invoke(debug=debug)
 
 elif subparser_name == 'create_database':
+    import asyncio
+    from .database_engine import create_engine
+    from .database_schema import create_database_async
+    config = ConfigParser()
+    config.read('powershell_bot.ini')
+    database_url = config[config.default_section]['database_url']
+
+    async def create_database_coro_fn() -> None:
+        engine = create_engine(database_url)
+        try:
+            await create_database_async(engine)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(create_database_coro_fn())
+
+elif subparser_name == 'migrate_database':
+    import asyncio
+    from .database_engine import create_engine
+    from .database_schema import migrate_database_async
     config = ConfigParser()
     config.read('powershell_bot.ini')
     database_url = config[config.default_section]['database_url']
-    engine = create_engine(database_url)
-    asyncio.run(create_database_async(engine))
+
+    async def migrate_database_coro_fn() -> list[str]:
+        engine = create_engine(database_url)
+        try:
+            return await migrate_database_async(engine)
+        finally:
+            await engine.dispose()
+
+    changes = asyncio.run(migrate_database_coro_fn())
+    for change in changes:
+        print(change)
+    if not changes:
+        print('Database is up to date')
 
 elif subparser_name == 'show_config':
     config = ConfigParser()
@@ -54,29 +113,104 @@ elif subparser_name == 'show_config':
     advanced_comment_replying_enabled = section.getboolean('advanced_comment_replying_enabled', False)
     username = section['username']
     password = section['password']
+    feature_extraction_cpu_budget = section.getfloat('feature_extraction_cpu_budget', .5)
+    record_cache_size = section.getint('record_cache_size', 1024)
+    archive_after_days = section.getfloat('archive_after_days', 30)
+    recheck_concurrency = section.getint('recheck_concurrency', 4)
+    inbox_concurrency = section.getint('inbox_concurrency', 4)
+    comment_replying_queue_size = section.getint('comment_replying_queue_size', 100)
+    snap_in_workers = section.getint('snap_in_workers', 2)
+    snap_in_timeout = section.getfloat('snap_in_timeout', 30)
     print(f'''\
 {database_url = })
 {username = }
 {password = }
 {target_subreddit_name = }
 {advanced_comment_replying_enabled = }
+{feature_extraction_cpu_budget = }
+{record_cache_size = }
+{archive_after_days = }
+{recheck_concurrency = }
+{inbox_concurrency = }
+{comment_replying_queue_size = }
+{snap_in_workers = }
+{snap_in_timeout = }
 ''', end='')
 
 elif subparser_name == 'test_one':
     target_id36: str = args.target
-    programs.test_one.run_invoke(int(target_id36, 36))
+    import redditwarp.http.transport.connectors.httpx  # noqa: F401
+    from .programs import test_one
+    test_one.run_invoke(int(target_id36, 36))
 
 elif subparser_name == 'test_many':
     n: int = args.n
-    programs.test_many.run_invoke(n=n)
+    workers: Optional[int] = args.workers
+    import redditwarp.http.transport.connectors.httpx  # noqa: F401
+    from .programs import test_many
+    test_many.run_invoke(n=n, workers=workers)
 
 elif subparser_name == 'test_string':
     text: str = args.text
-    programs.test_string.run_invoke(text)
+    engine_name: str = args.engine
+    from .programs import test_string
+    test_string.run_invoke(text, engine_name)
+
+elif subparser_name == 'test_engines':
+    n = args.n
+    seed: int = args.seed
+    from .programs import test_engines
+    test_engines.run_invoke(n, seed)
+
+elif subparser_name == 'test_query_plans':
+    n = args.n
+    from .programs import test_query_plans
+    test_query_plans.run_invoke(n)
+
+elif subparser_name == 'test_stream_resumption':
+    from .programs import test_stream_resumption
+    test_stream_resumption.run_invoke()
+
+elif subparser_name == 'benchmark_matcher':
+    sizes = args.sizes
+    give_up_after: float = args.give_up_after
+    from .programs import benchmark_matcher
+    benchmark_matcher.run_invoke(sizes, give_up_after)
+
+elif subparser_name == 'benchmark':
+    n = args.n
+    seed = args.seed
+    repeat: int = args.repeat
+    output: Optional[str] = args.output
+    from .programs import benchmark
+    benchmark.run_invoke(n, seed, repeat, output)
+
+elif subparser_name == 'compare_benchmarks':
+    old_path: str = args.old
+    new_path: str = args.new
+    threshold: float = args.threshold
+    from .programs import compare_benchmarks
+    compare_benchmarks.run_invoke(old_path, new_path, threshold)
+
+elif subparser_name == 'benchmark_records':
+    from .programs import benchmark_records
+    sizes = args.sizes
+    repeat = args.repeat
+    benchmark_records.run_invoke(sizes, repeat)
+
+elif subparser_name == 'benchmark_startup':
+    from .programs import benchmark_startup
+    subcommand: Optional[str] = args.subcommand
+    repeat = args.repeat
+    top: int = args.top
+    benchmark_startup.run_invoke(repeat, top, subcommand)
 
 elif subparser_name == 'process_targets':
     submission_id36s: Iterable[str] = args.submission_id36
-    programs.process_targets.run_invoke(submission_id36s)
+    workers = args.workers
+    import redditwarp.http.transport.connectors.httpx  # noqa: F401
+    from .programs import process_targets
+    process_targets.run_invoke(submission_id36s, workers)
 
 else:
     parser.print_usage(file=sys.stderr)
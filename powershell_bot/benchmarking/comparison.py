@@ -0,0 +1,42 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, NamedTuple
+if TYPE_CHECKING:
+    from typing import Mapping
+
+
+class TimingChange(NamedTuple):
+    name: str
+    old: float
+    new: float
+
+    @property
+    def ratio(self) -> float:
+        return self.new / self.old
+
+
+def compare_results(
+    old: Mapping[str, Any],
+    new: Mapping[str, Any],
+) -> list[TimingChange]:
+    """Pair up the timings common to two benchmark results, sorted worst first.
+
+    Raises `ValueError` if the results were not produced from the same corpus,
+    since the timings would not be comparable.
+    """
+    if old['format_version'] != new['format_version']:
+        raise ValueError('benchmark result format versions differ')
+    if old['corpus'] != new['corpus']:
+        raise ValueError('benchmark results were produced from different corpora')
+
+    old_timings: Mapping[str, float] = old['timings']
+    new_timings: Mapping[str, float] = new['timings']
+    changes = [
+        TimingChange(name, old_timings[name], new_timings[name])
+        for name in old_timings.keys() & new_timings.keys()
+    ]
+    changes.sort(key=lambda c: c.ratio, reverse=True)
+    return changes
+
+def find_regressions(changes: list[TimingChange], threshold: float) -> list[TimingChange]:
+    """Return the changes that are slower by more than `threshold` (e.g. `.1` for 10%)."""
+    return [c for c in changes if c.ratio > 1 + threshold]
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, NamedTuple
+if TYPE_CHECKING:
+    from typing import Callable, Sequence
+
+import gc
+import time
+import random
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from itertools import starmap
+
+from sqlalchemy import create_engine, insert, select
+
+from ..database_schema import metadata, record_table
+from ..models.record import Record
+from ..model_loaders.record import record_columns, load_record, load_records
+
+# `Record` as it was before it was slotted, for comparison.
+UnslottedRecord = make_dataclass('UnslottedRecord', [(f.name, f.type) for f in fields(Record)])
+
+
+class RecordLoadingResult(NamedTuple):
+    loader: str
+    n: int
+    seconds: float
+    bytes_per_record: float
+
+
+def generate_record_rows(n: int, seed: int = 0) -> Sequence[Any]:
+    """Return `n` result rows selected with `record_columns` from an in-memory database."""
+    rng = random.Random(seed)
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(record_table), [
+            {
+                'feature_flags': rng.randrange(32),
+                'recheck': True,
+                'target_submission_id': i,
+                'target_submission_created_ut': 1_600_000_000 + i,
+                'target_submission_author_name': f'user{rng.randrange(10**6)}',
+                'bot_comment_id': rng.choice((None, rng.randrange(36**7))),
+                'target_submission_edited_ut': None,
+                'target_submission_body_digest': rng.getrandbits(128).to_bytes(16, 'big'),
+                'bot_comment_body_digest': None,
+            }
+            for i in range(n)
+        ])
+        rows = conn.execute(select(*record_columns)).all()
+    engine.dispose()
+    return rows
+
+record_loaders: dict[str, Callable[[Sequence[Any]], list[Any]]] = {
+    'load_record': lambda rows: [load_record(row) for row in rows],
+    'load_records': load_records,
+    'unslotted': lambda rows: list(starmap(UnslottedRecord, rows)),
+}
+
+def measure_record_loading(rows: Sequence[Any], repeat: int) -> list[RecordLoadingResult]:
+    """Time each of `record_loaders` over `rows` (best of `repeat`) and measure
+    the memory the loaded records take up.
+    """
+    results = []
+    for name, loader in record_loaders.items():
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            records = loader(rows)
+            best = min(best, time.perf_counter() - t0)
+            del records
+
+        gc.collect()
+        tracemalloc.start()
+        records = loader(rows)
+        size, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del records
+
+        results.append(RecordLoadingResult(name, len(rows), best, size / len(rows)))
+    return results
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, NamedTuple
+if TYPE_CHECKING:
+    from typing import Mapping
+
+import sys
+import subprocess
+from pathlib import Path
+
+_package_name = __name__.partition('.')[0]
+
+subcommand_modules: Mapping[str, str] = {
+    'run': f'{_package_name}.programs.bot',
+    'create_database': f'{_package_name}.database_schema',
+    'test_one': f'{_package_name}.programs.test_one',
+    'test_many': f'{_package_name}.programs.test_many',
+    'test_string': f'{_package_name}.programs.test_string',
+    'test_engines': f'{_package_name}.programs.test_engines',
+    'benchmark': f'{_package_name}.programs.benchmark',
+    'process_targets': f'{_package_name}.programs.process_targets',
+}
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_import_time_report(report: str) -> list[ImportTime]:
+    """Parse the stderr output of `python -X importtime`."""
+    entries = []
+    for line in report.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_field, cumulative_field, name_field = line[len('import time:'):].split('|')
+        if not self_field.strip().isdigit():
+            # The header line.
+            continue
+        module = name_field.lstrip(' ')
+        depth = (len(name_field) - len(module) - 1) // 2
+        entries.append(ImportTime(module, int(self_field), int(cumulative_field), depth))
+    return entries
+
+def measure_import(module: str) -> list[ImportTime]:
+    """Import `module` in a fresh interpreter and return its import time report."""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=Path(__file__).resolve().parent.parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_import_time_report(process.stderr)
+
+def measure_import_time(module: str, repeat: int) -> tuple[int, list[ImportTime]]:
+    """Return the best cumulative import time of `module` in microseconds over
+    `repeat` fresh interpreters, and the report of that best run.
+    """
+    best_us = -1
+    best_report: list[ImportTime] = []
+    for _ in range(repeat):
+        report = measure_import(module)
+        us = next(e.cumulative_us for e in report if e.module == module)
+        if best_us < 0 or us < best_us:
+            best_us = us
+            best_report = report
+    return best_us, best_report
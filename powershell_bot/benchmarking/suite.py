@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from typing import Callable, Sequence
+
+import time
+import platform
+
+from ..__about__ import version_string
+from ..feature_extraction import (
+    FeatureFlags,
+    feature_flags_registry,
+    extraction_engines,
+    extract_features,
+    LazyFeatureFlags,
+    prefilter_statistics,
+)
+from ..message_building import (
+    MessageDeterminer,
+    get_message_determiner,
+    build_message,
+    compose_message,
+)
+from ..corpus_generation import generate_benchmark_corpus
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def time_per_item(func: Callable[[str], object], texts: Sequence[str], repeat: int) -> float:
+    """Return the best of `repeat` runs of `func` over `texts`, in seconds per text."""
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(texts)
+
+def process_submission_body(text: str) -> None:
+    """The work the bot does for one new submission, short of any I/O."""
+    det = get_message_determiner(extract_features(text))
+    if det is not None:
+        build_message(
+            determiner=det,
+            enlightened=False,
+            submission_id=1234567890,
+            permalink_path='/r/PowerShell/comments/kf9yah/benchmark/',
+            username='PowerShell-Bot',
+            submission_body_len=len(text),
+        )
+
+def determine_message_lazily(text: str) -> None:
+    get_message_determiner(LazyFeatureFlags(text))
+
+def time_message_building(n: int, repeat: int) -> dict[str, float]:
+    """Time rendering each kind of message, from its precompiled skeleton
+    (`message.skeleton.*`) and from scratch (`message.compose.*`).
+    """
+    permalink_paths = [f'/r/PowerShell/comments/{i:x}/benchmark/' for i in range(n)]
+    timings: dict[str, float] = {}
+    for determiner in MessageDeterminer:
+        def build(permalink_path: str) -> None:
+            build_message(
+                determiner=determiner,
+                enlightened=False,
+                submission_id=1234567890,
+                permalink_path=permalink_path,
+                username='PowerShell-Bot',
+                submission_body_len=len(permalink_path),
+            )
+
+        def compose(permalink_path: str) -> None:
+            compose_message(
+                determiner=determiner,
+                enlightened=False,
+                submission_id36='kf9yah',
+                permalink_path=permalink_path,
+                thing='benchmark',
+                username='PowerShell-Bot',
+                completed_in=str(len(permalink_path)),
+            )
+
+        timings[f'message.skeleton.{determiner.name}'] = time_per_item(build, permalink_paths, repeat)
+        timings[f'message.compose.{determiner.name}'] = time_per_item(compose, permalink_paths, repeat)
+    return timings
+
+def run_benchmarks(*, n: int, seed: int, repeat: int) -> dict[str, Any]:
+    """Run every benchmark and return the results in the JSON result format.
+
+    Timings are keyed `<kind>.<name>.<category>` and are in seconds per post,
+    so lower is better. Throughputs are in posts per second. Prefilter hit rates
+    are the fraction of detector evaluations skipped by a prefilter.
+    """
+    corpus = generate_benchmark_corpus(n, seed)
+    timings: dict[str, float] = {}
+    throughput: dict[str, float] = {}
+    prefilter_hit_rates: dict[str, float] = {}
+
+    for category, texts in corpus.items():
+        for flag, detector in feature_flags_registry.items():
+            timings[f'detector.{FeatureFlags(flag).name}.{category}'] = time_per_item(detector, texts, repeat)
+        for name, engine in extraction_engines.items():
+            timings[f'engine.{name}.{category}'] = time_per_item(engine, texts, repeat)
+        prefilter_statistics.reset()
+        for text in texts:
+            extract_features(text)
+        prefilter_hit_rates[category] = prefilter_statistics.hit_rate()
+
+        timings[f'pipeline.lazy_determination.{category}'] = time_per_item(determine_message_lazily, texts, repeat)
+        t = time_per_item(process_submission_body, texts, repeat)
+        timings[f'pipeline.end_to_end.{category}'] = t
+        throughput[f'pipeline.end_to_end.{category}'] = 1 / t
+
+    all_texts = [text for texts in corpus.values() for text in texts]
+    t = time_per_item(process_submission_body, all_texts, repeat)
+    timings['pipeline.end_to_end.all'] = t
+    throughput['pipeline.end_to_end.all'] = 1 / t
+
+    timings.update(time_message_building(n, repeat))
+
+    return {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'package_version': version_string,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'n': n, 'seed': seed, 'repeat': repeat},
+        'timings': timings,
+        'throughput': throughput,
+        'prefilter_hit_rates': prefilter_hit_rates,
+    }
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import Iterator, Callable, Sequence, Mapping
+
+import random
+
+
+class CorpusPartsStaticNamespace:
+    prose_sentences = (
+        "I'm trying to write a script that checks every server in a list.",
+        "It works when I run it by hand but fails in the scheduled task.",
+        "Any help would be appreciated, I'm pretty new to PowerShell.",
+        "The output is empty and I can't figure out why.",
+        "Here is what I have so far.",
+        "I get the following error when the function runs.",
+        "Is there a better way to do this?",
+        "Thanks in advance!",
+    )
+    code_lines = (
+        "$servers = Get-Content -Path C:\\temp\\servers.txt",
+        "foreach ($server in $servers) {",
+        "    Test-Connection -ComputerName $server -Count 1",
+        "}",
+        "function Get-Thing {",
+        "param(",
+        "    [string]$Name",
+        ")",
+        "if ($result -eq $null) {",
+        "Get-ChildItem C:\\Users | Where-Object { $_.Length -gt 1mb }",
+        "for ($i = 0; $i -lt 10; $i++) {",
+        "PS C:\\> Get-Service -Name spooler",
+        "$result | Export-Csv -Path out.csv -NoTypeInformation",
+        "Write-Host \"Done\"",
+    )
+
+
+def _prose(rng: random.Random) -> str:
+    return ' '.join(rng.choice(CorpusPartsStaticNamespace.prose_sentences) for _ in range(rng.randint(1, 4)))
+
+def _code_lines(rng: random.Random) -> list[str]:
+    return [rng.choice(CorpusPartsStaticNamespace.code_lines) for _ in range(rng.randint(1, 8))]
+
+def _plain_code(rng: random.Random) -> str:
+    return '\n'.join(_code_lines(rng))
+
+def _indented_code(rng: random.Random) -> str:
+    indent = rng.choice(('    ', '\t'))
+    return '\n'.join(indent + line for line in _code_lines(rng))
+
+def _fenced_code(rng: random.Random) -> str:
+    return '```' + rng.choice(('', 'powershell')) + '\n' + _plain_code(rng) + '\n```'
+
+def _inline_code(rng: random.Random) -> str:
+    return rng.choice(('\n', '\n\n')).join('`' + line + '`' for line in _code_lines(rng))
+
+def _long_inline_code(rng: random.Random) -> str:
+    return '`' + '; '.join(_code_lines(rng) * 4) + '`'
+
+def _stray_backticks(rng: random.Random) -> str:
+    return f"I tried `{rng.choice(CorpusPartsStaticNamespace.code_lines)}` but it didn't work."
+
+corpus_parts: tuple[Callable[[random.Random], str], ...] = (
+    _prose,
+    _prose,
+    _plain_code,
+    _indented_code,
+    _fenced_code,
+    _inline_code,
+    _long_inline_code,
+    _stray_backticks,
+)
+
+
+corpus_categories: Mapping[str, Sequence[Callable[[random.Random], str]]] = {
+    'prose': (_prose,),
+    'indented_blocks': (_prose, _indented_code),
+    'code_fences': (_prose, _fenced_code),
+    'inline_code': (_prose, _inline_code, _long_inline_code, _stray_backticks),
+    'mixed': corpus_parts,
+}
+
+
+def generate_submission_body(
+    rng: random.Random,
+    parts: Sequence[Callable[[random.Random], str]] = corpus_parts,
+    min_length: int = 0,
+) -> str:
+    chunks = [rng.choice(parts)(rng) for _ in range(rng.randint(1, 8))]
+    length = sum(map(len, chunks))
+    while length < min_length:
+        chunk = rng.choice(parts)(rng)
+        chunks.append(chunk)
+        length += len(chunk) + 2
+    return '\n\n'.join(chunks)
+
+def generate_corpus(n: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(seed)
+    for _ in range(n):
+        yield generate_submission_body(rng)
+
+
+def generate_adversarial_texts(size: int) -> dict[str, str]:
+    """Return single-line texts of about `size` characters that are known to
+    be expensive for the `code_outside_of_code_block` pattern.
+    """
+    def repeat(head: str, unit: str) -> str:
+        return head + unit * max(0, (size - len(head)) // len(unit))
+
+    return {
+        'for_loop_semicolons': repeat('for ($x', ';-ab'),
+        'minified_script': repeat('for ($i = 0', '; $x -eq 1'),
+        'if_parens': repeat('if ($x', ')'),
+        'log_dump': repeat('', '2023-03-01 12:00:00 INFO Get-Item: ok; '),
+        'long_inline_code': repeat('`', '$x = 1; ') + '`',
+    }
+
+
+def generate_benchmark_corpus(n: int, seed: int = 0) -> dict[str, list[str]]:
+    """Return `n` texts for each category of submission body the benchmarks cover.
+
+    On top of `corpus_categories` there are `long_bodies`, which are around
+    40,000 characters (the submission body length limit), and
+    `pathological_lines`, which embed the texts of `generate_adversarial_texts`
+    in ordinary prose.
+    """
+    rng = random.Random(seed)
+    corpus = {
+        name: [generate_submission_body(rng, parts) for _ in range(n)]
+        for name, parts in corpus_categories.items()
+    }
+    corpus['long_bodies'] = [generate_submission_body(rng, corpus_parts, 39000)[:40000] for _ in range(n)]
+    adversarial = list(generate_adversarial_texts(4000).values())
+    corpus['pathological_lines'] = [
+        _prose(rng) + '\n\n' + rng.choice(adversarial) + '\n\n' + _prose(rng)
+        for _ in range(n)
+    ]
+    return corpus
@@ -0,0 +1,91 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional
+if TYPE_CHECKING:
+    from typing import Mapping, Callable
+    from ..models.record import Record
+
+import time
+import dataclasses
+from collections import OrderedDict
+
+
+class RecordCache:
+    """A bounded LRU cache of records, keyed by record ID and by submission ID.
+
+    Entries expire `ttl` seconds after they were put in the cache. Updates
+    made through the `Service` are applied to cached records so that the
+    cache never serves a record older than the database.
+    """
+
+    def __init__(self, *, max_size: int = 1024, ttl: float = 15 * 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[Record, float]] = OrderedDict()
+        self._record_ids_by_submission_id: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, record_id: int) -> Optional[Record]:
+        entry = self._entries.get(record_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        record, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.discard(record_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(record_id)
+        self.hits += 1
+        return record
+
+    def get_by_submission_id(self, submission_id: int) -> Optional[Record]:
+        record_id = self._record_ids_by_submission_id.get(submission_id)
+        if record_id is None:
+            self.misses += 1
+            return None
+        return self.get(record_id)
+
+    def put(self, record: Record) -> None:
+        self.discard(record.id)
+        self._entries[record.id] = (record, time.monotonic() + self.ttl)
+        self._record_ids_by_submission_id[record.target_submission_id] = record.id
+        while len(self._entries) > self.max_size:
+            record_id, (evicted, _) = self._entries.popitem(last=False)
+            del self._record_ids_by_submission_id[evicted.target_submission_id]
+            self.evictions += 1
+
+    def update(self, record_id: int, values: Mapping[str, Any]) -> None:
+        """Apply column values to a cached record, if it is cached."""
+        entry = self._entries.get(record_id)
+        if entry is None:
+            return
+        record, expires_at = entry
+        self._entries[record_id] = (dataclasses.replace(record, **values), expires_at)
+
+    def update_where(self, predicate: Callable[[Record], bool], values: Mapping[str, Any]) -> None:
+        """Apply column values to every cached record matching `predicate`."""
+        for record_id, (record, expires_at) in self._entries.items():
+            if predicate(record):
+                self._entries[record_id] = (dataclasses.replace(record, **values), expires_at)
+
+    def discard(self, record_id: int) -> None:
+        entry = self._entries.pop(record_id, None)
+        if entry is not None:
+            del self._record_ids_by_submission_id[entry[0].target_submission_id]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._record_ids_by_submission_id.clear()
+
+    def get_statistics(self) -> dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -1,26 +1,215 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional, AsyncIterable
+from typing import TYPE_CHECKING, Any, Optional, AsyncIterable
 if TYPE_CHECKING:
     import sqlalchemy.ext.asyncio
     from ..models.record import Record
+    from .record_cache import RecordCache
 
 import asyncio
+import logging
+import weakref
+from contextlib import suppress
 
-from sqlalchemy import select, insert, update
+from sqlalchemy import select, insert, update, delete, bindparam, and_, or_, func
+from sqlalchemy.exc import IntegrityError, DataError
 
-from ..database_schema import record_table
-from ..model_loaders.record import load_record
+from ..database_schema import record_table, record_archive_table
+from ..model_loaders.record import record_columns, load_record, load_records
+
+# Errors caused by the values of a write rather than by the database. Retrying
+# such a write can't succeed.
+_WRITE_VALUE_ERRORS = (IntegrityError, DataError)
 
 
 class Service:
+    """Data access for the bot.
+
+    Writes are queued and applied in the background (write-behind): updates to
+    the same record are merged, and the queue is committed in one transaction
+    once `write_batch_size` writes are pending or `write_delay` seconds after
+    the first write, whichever comes first. When `max_pending_writes` is
+    reached, writers wait for the queue to be flushed. Reads flush the queue
+    first so they always see earlier writes.
+
+    A write that the database rejects (a duplicate record, say) is logged and
+    dropped without holding up the rest of the queue. The error is raised to
+    the task that made the write, on its next write or flush.
+
+    Call `flush` before disposing of the engine so no writes are lost.
+
+    If a `record_cache` is given, record lookups are served from it when
+    possible. Writes update cached records as they are queued.
+    """
+
     def __init__(self,
         *,
         engine: sqlalchemy.ext.asyncio.engine.AsyncEngine,
         haven: set[asyncio.Task[None]],
+        write_batch_size: int = 64,
+        write_delay: float = 1.,
+        max_pending_writes: int = 1024,
+        record_cache: Optional[RecordCache] = None,
+        logger: Optional[logging.Logger] = None,
     ) -> None:
         self._engine: sqlalchemy.ext.asyncio.engine.AsyncEngine = engine
         self._haven: set[asyncio.Task[None]] = haven
+        self._write_batch_size = write_batch_size
+        self._write_delay = write_delay
+        self._max_pending_writes = max_pending_writes
+        self._record_cache = record_cache
+        self._logger = logging.getLogger(__name__) if logger is None else logger
+        self._pending_inserts: list[tuple[dict[str, Any], Optional[asyncio.Task[Any]]]] = []
+        self._pending_updates: dict[int, dict[str, Any]] = {}
+        self._pending_update_writers: dict[int, set[asyncio.Task[Any]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_wanted = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task[None]] = None
+        self._write_errors: weakref.WeakKeyDictionary[asyncio.Task[Any], Exception] = weakref.WeakKeyDictionary()
+
+    @property
+    def pending_write_count(self) -> int:
+        return len(self._pending_inserts) + len(self._pending_updates)
+
+    async def flush(self) -> None:
+        """Commit all pending writes.
+
+        The writes are committed in one transaction. If the database rejects
+        that transaction, the writes are retried one at a time and those that
+        are rejected again are dropped. If the transaction fails for any other
+        reason, the remaining writes are put back in the queue and the
+        exception is raised. If one of the caller's own writes is dropped,
+        its error is raised too.
+        """
+        self._raise_write_error()
+        await self._flush()
+        self._raise_write_error()
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            inserts = self._pending_inserts
+            updates = self._pending_updates
+            update_writers = self._pending_update_writers
+            if not (inserts or updates):
+                return
+            self._pending_inserts = []
+            self._pending_updates = {}
+            self._pending_update_writers = {}
+
+            try:
+                await self._execute_writes([values for values, _writer in inserts], updates)
+            except _WRITE_VALUE_ERRORS:
+                pass
+            except BaseException:
+                self._requeue_writes(inserts, updates, update_writers)
+                raise
+            else:
+                return
+
+            self._logger.warning('A batch of %d database writes was rejected. Retrying them one at a time', len(inserts) + len(updates))
+            for i, (values, writer) in enumerate(inserts):
+                try:
+                    await self._execute_writes([values], {})
+                except _WRITE_VALUE_ERRORS as e:
+                    self._drop_write(e, values, {writer} if writer is not None else set())
+                except BaseException:
+                    self._requeue_writes(inserts[i:], updates, update_writers)
+                    raise
+
+            update_items = list(updates.items())
+            for i, (record_id, values) in enumerate(update_items):
+                try:
+                    await self._execute_writes([], {record_id: values})
+                except _WRITE_VALUE_ERRORS as e:
+                    self._drop_write(e, {'record_id': record_id, **values}, update_writers.get(record_id, set()))
+                    # The cached record already has the dropped values applied.
+                    if self._record_cache is not None:
+                        self._record_cache.discard(record_id)
+                except BaseException:
+                    self._requeue_writes([], dict(update_items[i:]), update_writers)
+                    raise
+
+    async def _execute_writes(self, inserts: list[dict[str, Any]], updates: dict[int, dict[str, Any]]) -> None:
+        update_groups: dict[frozenset[str], list[dict[str, Any]]] = {}
+        for record_id, values in updates.items():
+            update_groups.setdefault(frozenset(values), []).append({'record_id': record_id, **values})
+
+        async with self._engine.begin() as conn:
+            if inserts:
+                await conn.execute(insert(record_table), inserts)
+            for params in update_groups.values():
+                await conn.execute(
+                    update(record_table).where(record_table.c.id == bindparam('record_id')),
+                    params,
+                )
+
+    def _requeue_writes(self,
+        inserts: list[tuple[dict[str, Any], Optional[asyncio.Task[Any]]]],
+        updates: dict[int, dict[str, Any]],
+        update_writers: dict[int, set[asyncio.Task[Any]]],
+    ) -> None:
+        # Requeue without clobbering anything written since.
+        self._pending_inserts[:0] = inserts
+        for record_id, values in updates.items():
+            self._pending_updates[record_id] = {**values, **self._pending_updates.get(record_id, {})}
+            self._pending_update_writers.setdefault(record_id, set()).update(update_writers.get(record_id, ()))
+
+    def _drop_write(self, error: Exception, values: dict[str, Any], writers: set[asyncio.Task[Any]]) -> None:
+        self._logger.error('Dropping a database write that was rejected: %r', values, exc_info=error)
+        for writer in writers:
+            if not writer.done():
+                self._write_errors[writer] = error
+
+    def _raise_write_error(self) -> None:
+        task = asyncio.current_task()
+        if task is None:
+            return
+        e = self._write_errors.pop(task, None)
+        if e is not None:
+            raise e
+
+    async def _flush_soon(self) -> None:
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._flush_wanted.wait(), self._write_delay)
+        self._flush_wanted.clear()
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception:
+            # The writes stay queued for the next flush.
+            self._logger.error('Failed to flush database writes', exc_info=True)
+
+    async def _after_write_queued(self) -> None:
+        n = self.pending_write_count
+        if n >= self._max_pending_writes:
+            flush_task = asyncio.create_task(self.flush())
+            self._haven.add(flush_task)
+            flush_task.add_done_callback(self._haven.discard)
+            await asyncio.shield(flush_task)
+            return
+
+        if self._flush_task is None:
+            task = asyncio.create_task(self._flush_soon())
+            self._haven.add(task)
+            task.add_done_callback(self._haven.discard)
+            self._flush_task = task
+        if n >= self._write_batch_size:
+            self._flush_wanted.set()
+
+    async def _queue_insert(self, values: dict[str, Any]) -> None:
+        self._raise_write_error()
+        self._pending_inserts.append((values, asyncio.current_task()))
+        await self._after_write_queued()
+
+    async def _queue_update(self, record_id: int, values: dict[str, Any]) -> None:
+        self._raise_write_error()
+        self._pending_updates.setdefault(record_id, {}).update(values)
+        writer = asyncio.current_task()
+        if writer is not None:
+            self._pending_update_writers.setdefault(record_id, set()).add(writer)
+        if self._record_cache is not None:
+            self._record_cache.update(record_id, values)
+        await self._after_write_queued()
 
     async def add_record(self,
         *,
@@ -30,72 +219,175 @@ class Service:
         target_submission_created_ut: int,
         target_submission_author_name: str,
         bot_comment_id: Optional[int],
+        target_submission_edited_ut: Optional[int] = None,
+        target_submission_body_digest: Optional[bytes] = None,
+        bot_comment_body_digest: Optional[bytes] = None,
     ) -> None:
-        record_data = {
+        await self._queue_insert({
             'feature_flags': feature_flags,
             'recheck': recheck,
             'target_submission_id': target_submission_id,
             'target_submission_created_ut': target_submission_created_ut,
             'target_submission_author_name': target_submission_author_name,
             'bot_comment_id': bot_comment_id,
-        }
+            'target_submission_edited_ut': target_submission_edited_ut,
+            'target_submission_body_digest': target_submission_body_digest,
+            'bot_comment_body_digest': bot_comment_body_digest,
+        })
 
-        async def coro_fn() -> None:
+    async def produce_rechecking_records(self,
+        *,
+        page_size: int = 100,
+        due_ut: Optional[int] = None,
+    ) -> AsyncIterable[Record]:
+        """Yield the records still being rechecked, oldest submission first.
+
+        If `due_ut` is given, only records whose next recheck is due by then
+        (or has never been scheduled) are yielded.
+
+        Records are read a page at a time by keyset, and no connection is held
+        while the consumer processes a page.
+        """
+        await self.flush()
+        created_ut_column = record_table.c.target_submission_created_ut
+        stmt = (
+            select(*record_columns)
+            .where(record_table.c.recheck)
+            .order_by(created_ut_column, record_table.c.id)
+            .limit(page_size)
+        )
+        if due_ut is not None:
+            next_recheck_ut_column = record_table.c.next_recheck_ut
+            stmt = stmt.where(or_(next_recheck_ut_column.is_(None), next_recheck_ut_column <= due_ut))
+        page_stmt = stmt
+        while True:
             async with self._engine.connect() as conn:
-                await conn.execute(
-                    insert(record_table),
-                    record_data,
-                )
-                await conn.commit()
+                records = load_records((await conn.execute(page_stmt)).all())
 
-        task = asyncio.create_task(coro_fn())
-        self._haven.add(task)
-        task.add_done_callback(self._haven.remove)
-        await asyncio.shield(task)
+            for record in records:
+                yield record
 
-    async def produce_rechecking_records(self) -> AsyncIterable[Record]:
+            if len(records) < page_size:
+                break
+            last = records[-1]
+            page_stmt = stmt.where(or_(
+                created_ut_column > last.target_submission_created_ut,
+                and_(created_ut_column == last.target_submission_created_ut, record_table.c.id > last.id),
+            ))
+
+    async def count_rechecking_records(self) -> int:
+        await self.flush()
         async with self._engine.connect() as conn:
-            result = await conn.execute(select(record_table).where(record_table.c.recheck))
-            for row in result:
-                yield load_record(row)
+            result = await conn.execute(select(func.count()).select_from(record_table).where(record_table.c.recheck))
+            return result.scalar_one()
+
+    async def expire_rechecking(self, created_before_ut: int) -> int:
+        """Stop rechecking every record whose submission was created before the
+        given time, in one statement. Returns the number of records affected.
+        """
+        count = 0
 
-    async def deactivate_rechecking(self, record_id: int) -> None:
         async def coro_fn() -> None:
-            async with self._engine.connect() as conn:
-                await conn.execute(update(record_table).where(record_table.c.id == record_id), {'recheck': False})
-                await conn.commit()
+            nonlocal count
+            await self.flush()
+            async with self._engine.begin() as conn:
+                result = await conn.execute(
+                    update(record_table)
+                    .where(record_table.c.recheck)
+                    .where(record_table.c.target_submission_created_ut < created_before_ut)
+                    .values(recheck=False)
+                )
+                count = result.rowcount
+
+            if self._record_cache is not None:
+                self._record_cache.update_where(
+                    lambda record: record.target_submission_created_ut < created_before_ut,
+                    {'recheck': False},
+                )
 
         task = asyncio.create_task(coro_fn())
         self._haven.add(task)
-        task.add_done_callback(self._haven.remove)
+        task.add_done_callback(self._haven.discard)
         await asyncio.shield(task)
+        return count
 
-    async def set_bot_comment_id(self, record_id: int, bot_comment_id: int) -> None:
-        async def coro_fn() -> None:
-            async with self._engine.connect() as conn:
-                await conn.execute(update(record_table).where(record_table.c.id == record_id), {'bot_comment_id': bot_comment_id})
-                await conn.commit()
+    async def deactivate_rechecking(self, record_id: int) -> None:
+        await self._queue_update(record_id, {'recheck': False})
 
-        task = asyncio.create_task(coro_fn())
-        self._haven.add(task)
-        task.add_done_callback(self._haven.remove)
-        await asyncio.shield(task)
+    async def set_bot_comment_id(self, record_id: int, bot_comment_id: int, body_digest: Optional[bytes] = None) -> None:
+        await self._queue_update(record_id, {'bot_comment_id': bot_comment_id, 'bot_comment_body_digest': body_digest})
+
+    async def set_bot_comment_body_digest(self, record_id: int, body_digest: bytes) -> None:
+        await self._queue_update(record_id, {'bot_comment_body_digest': body_digest})
 
     async def set_feature_flags(self, record_id: int, feature_flags: int) -> None:
+        await self._queue_update(record_id, {'feature_flags': feature_flags})
+
+    async def set_next_recheck_ut(self, record_id: int, next_recheck_ut: int) -> None:
+        await self._queue_update(record_id, {'next_recheck_ut': next_recheck_ut})
+
+    async def set_target_submission_snapshot(self, record_id: int, edited_ut: int, body_digest: bytes) -> None:
+        await self._queue_update(record_id, {'target_submission_edited_ut': edited_ut, 'target_submission_body_digest': body_digest})
+
+    async def archive_records(self, created_before_ut: int, batch_size: int) -> int:
+        """Move up to `batch_size` records that are no longer rechecked and whose
+        submission was created before the given time into the archive table.
+        Returns the number of records moved.
+
+        Archived records can still be looked up with `get_record_by_submission_id`
+        but writes to them are ignored.
+        """
+        count = 0
+
         async def coro_fn() -> None:
-            async with self._engine.connect() as conn:
-                await conn.execute(update(record_table).where(record_table.c.id == record_id), {'feature_flags': feature_flags})
-                await conn.commit()
+            nonlocal count
+            await self.flush()
+            async with self._engine.begin() as conn:
+                result = await conn.execute(
+                    select(record_table.c.id)
+                    .where(~record_table.c.recheck)
+                    .where(record_table.c.target_submission_created_ut < created_before_ut)
+                    .order_by(record_table.c.id)
+                    .limit(batch_size)
+                )
+                record_ids = result.scalars().all()
+                if not record_ids:
+                    return
+
+                await conn.execute(
+                    insert(record_archive_table).from_select(
+                        list(record_archive_table.c.keys()),
+                        select(*(record_table.c[name] for name in record_archive_table.c.keys()))
+                        .where(record_table.c.id.in_(record_ids)),
+                    )
+                )
+                await conn.execute(delete(record_table).where(record_table.c.id.in_(record_ids)))
+                count = len(record_ids)
 
         task = asyncio.create_task(coro_fn())
         self._haven.add(task)
-        task.add_done_callback(self._haven.remove)
+        task.add_done_callback(self._haven.discard)
         await asyncio.shield(task)
+        return count
 
     async def get_record_by_submission_id(self, submission_id: int) -> Optional[Record]:
+        cache = self._record_cache
+        if cache is not None:
+            record = cache.get_by_submission_id(submission_id)
+            if record is not None:
+                return record
+
+        await self.flush()
         async with self._engine.connect() as conn:
             result = await conn.execute(select(record_table).where(record_table.c.target_submission_id == submission_id))
             row = result.first()
+            if row is None:
+                result = await conn.execute(select(record_archive_table).where(record_archive_table.c.target_submission_id == submission_id))
+                row = result.first()
             if row is None:
                 return None
-            return load_record(row)
+            record = load_record(row)
+
+        if cache is not None:
+            cache.put(record)
+        return record
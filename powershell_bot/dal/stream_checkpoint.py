@@ -0,0 +1,139 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    import sqlalchemy.ext.asyncio
+
+import asyncio
+import bisect
+import json
+import time
+
+from sqlalchemy import select, insert, update
+from redditwarp.util.ordered_set import BoundedSet
+
+from ..database_schema import stream_checkpoint_table
+
+
+class StreamCheckpoint:
+    """The position of a stream: the newest item the bot has finished handling.
+
+    Report each item with `begin` when it arrives and with `complete` once it
+    has been handled. `begin` returns false for an item that has been seen
+    already, so that an item that comes from both the live stream and the
+    catch-up after a restart is only handled once. The position never moves
+    past an item that is still being handled, so if the bot stops, every
+    item older than the saved position was handled. Items handled beyond the
+    position are saved alongside it and are seen already after a restart.
+
+    While the checkpoint is held (see `hold`) the position doesn't move at
+    all, because older items may still be on their way.
+
+    The position is kept in memory; `save` writes it to the database.
+    """
+
+    def __init__(self,
+        *,
+        engine: sqlalchemy.ext.asyncio.engine.AsyncEngine,
+        name: str,
+    ) -> None:
+        self._engine: sqlalchemy.ext.asyncio.engine.AsyncEngine = engine
+        self.name = name
+        self.last_seen_fullname: Optional[str] = None
+        self.last_seen_ut: Optional[int] = None
+        self._seen: BoundedSet[str] = BoundedSet((), 2000)
+        self._in_flight: dict[str, int] = {}
+        # Completed items newer than the position, in order.
+        self._completed: list[tuple[int, str]] = []
+        self._hold_count = 0
+        self._unsaved = False
+        self._changed = asyncio.Event()
+
+    async def load(self) -> None:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(stream_checkpoint_table)
+                .where(stream_checkpoint_table.c.stream_name == self.name)
+            )
+            row = result.first()
+        if row is not None:
+            self.last_seen_fullname = row.last_seen_fullname
+            self.last_seen_ut = row.last_seen_ut
+            self._seen.add(row.last_seen_fullname)
+            for created_ut, fullname in json.loads(row.completed_items or '[]'):
+                self._seen.add(fullname)
+                self._completed.append((created_ut, fullname))
+            self._completed.sort()
+
+    def begin(self, fullname: str, created_ut: int) -> bool:
+        if fullname in self._seen:
+            return False
+        self._seen.add(fullname)
+        self._in_flight[fullname] = created_ut
+        return True
+
+    def complete(self, fullname: str) -> None:
+        created_ut = self._in_flight.pop(fullname)
+        bisect.insort(self._completed, (created_ut, fullname))
+        self._mark_changed()
+        self._advance()
+
+    def hold(self) -> None:
+        """Keep the position where it is until `release` is called."""
+        self._hold_count += 1
+
+    def release(self) -> None:
+        self._hold_count -= 1
+        self._advance()
+
+    async def wait_changed(self) -> None:
+        """Wait until there is something new to save."""
+        await self._changed.wait()
+
+    def _advance(self) -> None:
+        if self._hold_count:
+            return
+        # Move up to the newest completed item older than every item in flight.
+        oldest_in_flight_ut = min(self._in_flight.values(), default=None)
+        if oldest_in_flight_ut is None:
+            n = len(self._completed)
+        else:
+            n = bisect.bisect_left(self._completed, (oldest_in_flight_ut, ''))
+        if not n:
+            return
+        created_ut, fullname = self._completed[n - 1]
+        del self._completed[:n]
+        if self.last_seen_ut is not None and created_ut < self.last_seen_ut:
+            return
+        self.last_seen_ut = created_ut
+        self.last_seen_fullname = fullname
+        self._mark_changed()
+
+    def _mark_changed(self) -> None:
+        self._unsaved = True
+        self._changed.set()
+
+    async def save(self) -> None:
+        """Write the position to the database, if it changed since it was last written."""
+        if not self._unsaved or self.last_seen_fullname is None or self.last_seen_ut is None:
+            return
+        values = {
+            'last_seen_fullname': self.last_seen_fullname,
+            'last_seen_ut': self.last_seen_ut,
+            'saved_ut': int(time.time()),
+            'completed_items': json.dumps(self._completed),
+        }
+        self._unsaved = False
+        self._changed.clear()
+        try:
+            async with self._engine.begin() as conn:
+                result = await conn.execute(
+                    update(stream_checkpoint_table)
+                    .where(stream_checkpoint_table.c.stream_name == self.name)
+                    .values(values)
+                )
+                if result.rowcount == 0:
+                    await conn.execute(insert(stream_checkpoint_table).values(stream_name=self.name, **values))
+        except BaseException:
+            self._mark_changed()
+            raise
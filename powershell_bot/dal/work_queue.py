@@ -0,0 +1,184 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional
+if TYPE_CHECKING:
+    import sqlalchemy.ext.asyncio
+
+import asyncio
+import json
+import time
+from collections import Counter
+from contextlib import suppress
+
+from sqlalchemy import select, insert, update, delete, func
+
+from ..database_schema import work_item_table
+from ..models.work_item import WorkItem
+
+
+class WorkQueue:
+    """A persistent, bounded FIFO queue of JSON-serialisable payloads, kept in
+    the database so that queued work survives restarts.
+
+    Delivery is at-least-once. `get` doesn't remove an item; it hides it from
+    consumers for `visibility_timeout` seconds, and the consumer removes it
+    with `ack` once the work is done. An item that isn't acknowledged in time
+    (because the bot stopped mid-way, say) is delivered again, and `retry`
+    makes an item visible again early. An item that has been delivered
+    `max_attempts` times without being acknowledged is dropped.
+
+    The queue holds at most `max_size` items. `enqueue` waits for space for
+    up to `timeout` seconds and reports whether the item was queued, so the
+    producer decides what to do when the queue is full.
+
+    Several queues can share the table; they are told apart by `name`.
+    """
+
+    def __init__(self,
+        *,
+        engine: sqlalchemy.ext.asyncio.engine.AsyncEngine,
+        name: str,
+        max_size: int = 1000,
+        visibility_timeout: int = 5 * 60,
+        max_attempts: int = 5,
+        poll_interval: float = 10.,
+    ) -> None:
+        self._engine: sqlalchemy.ext.asyncio.engine.AsyncEngine = engine
+        self.name = name
+        self.max_size = max_size
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        # How often waiters check the table for changes made by other processes
+        # and for items whose visibility timeout has run out.
+        self.poll_interval = poll_interval
+        self._item_added = asyncio.Event()
+        self._space_freed = asyncio.Event()
+        self._counter: Counter[str] = Counter()
+
+    async def count(self) -> int:
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(func.count())
+                .select_from(work_item_table)
+                .where(work_item_table.c.queue_name == self.name)
+            )
+            return result.scalar_one()
+
+    async def try_enqueue(self, payload: Any) -> bool:
+        """Add an item to the queue unless the queue is full."""
+        now_ut = int(time.time())
+        async with self._engine.begin() as conn:
+            result = await conn.execute(
+                select(func.count())
+                .select_from(work_item_table)
+                .where(work_item_table.c.queue_name == self.name)
+            )
+            if result.scalar_one() >= self.max_size:
+                return False
+            await conn.execute(insert(work_item_table).values(
+                queue_name=self.name,
+                payload=json.dumps(payload),
+                enqueued_ut=now_ut,
+                visible_ut=now_ut,
+                attempts=0,
+            ))
+        self._counter['enqueued'] += 1
+        self._item_added.set()
+        return True
+
+    async def enqueue(self, payload: Any, *, timeout: float = 0.) -> bool:
+        """Add an item to the queue, waiting up to `timeout` seconds for space.
+
+        Returns false, and counts the item as rejected, if the queue is
+        still full after that.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self._space_freed.clear()
+            if await self.try_enqueue(payload):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._counter['rejected'] += 1
+                return False
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._space_freed.wait(), min(remaining, self.poll_interval))
+
+    async def dequeue(self) -> Optional[WorkItem]:
+        """Take the oldest visible item, or return `None` if there is none."""
+        now_ut = int(time.time())
+        dropped = 0
+        item = None
+        async with self._engine.begin() as conn:
+            while True:
+                result = await conn.execute(
+                    select(work_item_table)
+                    .where(work_item_table.c.queue_name == self.name)
+                    .where(work_item_table.c.visible_ut <= now_ut)
+                    .order_by(work_item_table.c.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                )
+                row = result.first()
+                if row is None:
+                    break
+                if row.attempts >= self.max_attempts:
+                    await conn.execute(delete(work_item_table).where(work_item_table.c.id == row.id))
+                    dropped += 1
+                    continue
+
+                await conn.execute(
+                    update(work_item_table)
+                    .where(work_item_table.c.id == row.id)
+                    .values(visible_ut=now_ut + self.visibility_timeout, attempts=row.attempts + 1)
+                )
+                item = WorkItem(
+                    id=row.id,
+                    queue_name=row.queue_name,
+                    payload=json.loads(row.payload),
+                    enqueued_ut=row.enqueued_ut,
+                    attempts=row.attempts + 1,
+                )
+                break
+
+        if dropped:
+            self._counter['dropped'] += dropped
+            self._space_freed.set()
+        if item is not None:
+            self._counter['dequeued'] += 1
+        return item
+
+    async def get(self) -> WorkItem:
+        """Wait for an item and take it."""
+        while True:
+            self._item_added.clear()
+            item = await self.dequeue()
+            if item is not None:
+                return item
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._item_added.wait(), self.poll_interval)
+
+    async def ack(self, item: WorkItem) -> None:
+        """Remove an item whose work is done."""
+        async with self._engine.begin() as conn:
+            await conn.execute(delete(work_item_table).where(work_item_table.c.id == item.id))
+        self._counter['acked'] += 1
+        self._space_freed.set()
+
+    async def retry(self, item: WorkItem, delay: int = 0) -> None:
+        """Make an item visible again after `delay` seconds, for another attempt."""
+        async with self._engine.begin() as conn:
+            await conn.execute(
+                update(work_item_table)
+                .where(work_item_table.c.id == item.id)
+                .values(visible_ut=int(time.time()) + delay)
+            )
+        self._counter['retried'] += 1
+        if not delay:
+            self._item_added.set()
+
+    def get_statistics(self) -> dict[str, int]:
+        return {
+            key: self._counter[key]
+            for key in ('enqueued', 'rejected', 'dequeued', 'acked', 'retried', 'dropped')
+        }
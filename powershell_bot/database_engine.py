@@ -0,0 +1,86 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio.engine import AsyncEngine
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+sqlite_pragmas: dict[str, object] = {
+    # Readers don't block the writer and the writer doesn't block readers,
+    # so the bot and a `process_targets` run can share a database file.
+    'journal_mode': 'WAL',
+    # In WAL mode this is still safe against corruption; only the last
+    # transactions can be lost on power failure.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Wait for a lock held by another process instead of failing at once.
+    'busy_timeout': 5000,
+}
+
+def _set_sqlite_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+def create_engine(
+    database_url: str,
+    *,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    query_cache_size: int = 1200,
+) -> AsyncEngine:
+    """Create the database engine, tuned for the dialect.
+
+    All of the program's entry points connect through this.
+
+    SQLite connections are pooled and get the pragmas in `sqlite_pragmas`.
+    For server databases, connections are pre-pinged on checkout so that
+    connections dropped while the bot was idle are replaced transparently.
+
+    `query_cache_size` is the size of SQLAlchemy's compiled statement cache.
+    The program only runs a few dozen distinct statements, so the default
+    leaves plenty of room.
+    """
+    url = make_url(database_url)
+    kwargs: dict[str, Any] = {'query_cache_size': query_cache_size}
+    if url.get_backend_name() == 'sqlite':
+        if url.database not in (None, '', ':memory:'):
+            kwargs.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+            )
+    else:
+        kwargs.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=60 * 60,
+        )
+
+    engine = create_async_engine(url, **kwargs)
+    if url.get_backend_name() == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+def get_pool_statistics(engine: AsyncEngine) -> dict[str, int]:
+    """Return the state of the engine's connection pool, for monitoring.
+
+    Pools that don't keep connections (such as the one used for in-memory
+    SQLite databases) have no statistics, and an empty dict is returned.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
@@ -2,24 +2,96 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from sqlalchemy.engine import Engine
+    from sqlalchemy.engine import Engine, Connection
     from sqlalchemy.ext.asyncio.engine import AsyncEngine
 
-from sqlalchemy.schema import MetaData, Table, Column
-from sqlalchemy.types import SmallInteger, BigInteger, String, Boolean
+from sqlalchemy import inspect, select, delete, func
+from sqlalchemy.schema import MetaData, Table, Column, Index
+from sqlalchemy.sql import text, true
+from sqlalchemy.types import SmallInteger, Integer, BigInteger, String, Boolean, LargeBinary, Text
 
 metadata = MetaData()
 
 record_table = Table(
     'record',
     metadata,
-    Column('id', BigInteger, primary_key=True, nullable=False),
+    # SQLite only autoincrements a primary key declared exactly as INTEGER.
+    Column('id', BigInteger().with_variant(Integer(), 'sqlite'), primary_key=True, nullable=False),
     Column('feature_flags', SmallInteger, nullable=False),
     Column('recheck', Boolean, nullable=False),
     Column('target_submission_id', BigInteger, nullable=False),
     Column('target_submission_created_ut', BigInteger, nullable=False),
     Column('target_submission_author_name', String(24), nullable=False),
     Column('bot_comment_id', BigInteger, nullable=True),
+    Column('target_submission_edited_ut', BigInteger, nullable=True),
+    Column('target_submission_body_digest', LargeBinary(16), nullable=True),
+    Column('bot_comment_body_digest', LargeBinary(16), nullable=True),
+    Column('next_recheck_ut', BigInteger, nullable=True),
+)
+
+# Deletion requests and comment replies look records up by submission.
+Index('record_target_submission_id_idx', record_table.c.target_submission_id, unique=True)
+# Recheck sweeps page through the records still being rechecked, oldest
+# first, by keyset on (target_submission_created_ut, id).
+Index(
+    'record_rechecking_idx',
+    record_table.c.target_submission_created_ut,
+    record_table.c.id,
+    postgresql_where=record_table.c.recheck,
+    # SQLite only uses a partial index if the query's condition matches its
+    # condition as written, and queries on booleans are compiled to `= 1`.
+    sqlite_where=record_table.c.recheck == true(),
+)
+
+# Records that are no longer rechecked are moved here once they reach a
+# certain age, to keep the record table small. Rows keep their record IDs.
+record_archive_table = Table(
+    'record_archive',
+    metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False, nullable=False),
+    Column('feature_flags', SmallInteger, nullable=False),
+    Column('recheck', Boolean, nullable=False),
+    Column('target_submission_id', BigInteger, nullable=False),
+    Column('target_submission_created_ut', BigInteger, nullable=False),
+    Column('target_submission_author_name', String(24), nullable=False),
+    Column('bot_comment_id', BigInteger, nullable=True),
+    Column('target_submission_edited_ut', BigInteger, nullable=True),
+    Column('target_submission_body_digest', LargeBinary(16), nullable=True),
+    Column('bot_comment_body_digest', LargeBinary(16), nullable=True),
+    Column('next_recheck_ut', BigInteger, nullable=True),
+)
+
+# Deletion requests on old submissions fall back to the archive.
+Index('record_archive_target_submission_id_idx', record_archive_table.c.target_submission_id, unique=True)
+
+# Items of the persistent work queues (see `dal.work_queue.WorkQueue`).
+# An item is hidden from consumers until `visible_ut`.
+work_item_table = Table(
+    'work_item',
+    metadata,
+    Column('id', BigInteger().with_variant(Integer(), 'sqlite'), primary_key=True, nullable=False),
+    Column('queue_name', String(64), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('enqueued_ut', BigInteger, nullable=False),
+    Column('visible_ut', BigInteger, nullable=False),
+    Column('attempts', Integer, nullable=False),
+)
+
+# Consumers take the oldest visible item of a queue.
+Index('work_item_dequeue_idx', work_item_table.c.queue_name, work_item_table.c.visible_ut, work_item_table.c.id)
+
+# How far each of the bot's streams had got (see `dal.stream_checkpoint.StreamCheckpoint`),
+# so that after a restart the bot can catch up on what it missed.
+stream_checkpoint_table = Table(
+    'stream_checkpoint',
+    metadata,
+    Column('stream_name', String(64), primary_key=True, nullable=False),
+    Column('last_seen_fullname', String(24), nullable=False),
+    Column('last_seen_ut', BigInteger, nullable=False),
+    Column('saved_ut', BigInteger, nullable=False),
+    # A JSON list of `[created_ut, fullname]` pairs of the items handled that are
+    # newer than the last seen item, so that they aren't handled again after a restart.
+    Column('completed_items', Text, nullable=True),
 )
 
 def create_database(engine: Engine) -> None:
@@ -29,3 +101,74 @@ async def create_database_async(engine: AsyncEngine) -> None:
     async with engine.connect() as conn:
         await conn.run_sync(metadata.create_all)
         await conn.commit()
+
+def migrate_database_connection(conn: Connection) -> list[str]:
+    """Bring an existing database up to date with the schema in place.
+
+    Missing tables are created, missing columns are added (only nullable
+    columns can be added this way) and missing indexes are created. An index
+    whose columns or uniqueness differ from the schema is dropped and created
+    again. Before a unique index is created, rows that duplicate a newer row's
+    key are deleted. Returns a description of each change made.
+    """
+    inspector = inspect(conn)
+    changes = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            table.create(conn)
+            changes.append(f'created table {table.name}')
+            continue
+
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f'cannot add non-nullable column in place: {table.name}.{column.name}')
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            changes.append(f'added column {table.name}.{column.name}')
+
+        existing_indexes = {i['name']: i for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            existing_index = existing_indexes.get(index.name)
+            if existing_index is not None:
+                if (
+                    existing_index['column_names'] == [column.name for column in index.columns]
+                    and bool(existing_index['unique']) == bool(index.unique)
+                ):
+                    continue
+                index.drop(conn)
+            if index.unique:
+                changes.extend(delete_duplicate_rows(conn, table, index))
+            index.create(conn)
+            changes.append(f'{"recreated" if existing_index is not None else "created"} index {index.name}')
+    return changes
+
+def delete_duplicate_rows(conn: Connection, table: Table, index: Index) -> list[str]:
+    """Delete the rows that would violate a unique index, keeping the row with
+    the highest primary key (the newest) for each key.
+    """
+    (pk_column,) = table.primary_key.columns
+    key_columns = list(index.columns)
+    result = conn.execute(
+        select(*key_columns, func.max(pk_column))
+        .group_by(*key_columns)
+        .having(func.count() > 1)
+    )
+    changes = []
+    for *key, kept_pk in result.all():
+        key_condition = [column == value for column, value in zip(key_columns, key)]
+        deleted_pks = conn.execute(select(pk_column).where(*key_condition, pk_column != kept_pk)).scalars().all()
+        conn.execute(delete(table).where(*key_condition, pk_column != kept_pk))
+        key_desc = ', '.join(f'{column.name}={value}' for column, value in zip(key_columns, key))
+        changes.append(f'deleted duplicate {table.name} rows {sorted(deleted_pks)} with {key_desc}, keeping row {kept_pk}')
+    return changes
+
+def migrate_database(engine: Engine) -> list[str]:
+    with engine.begin() as conn:
+        return migrate_database_connection(conn)
+
+async def migrate_database_async(engine: AsyncEngine) -> list[str]:
+    async with engine.begin() as conn:
+        return await conn.run_sync(migrate_database_connection)
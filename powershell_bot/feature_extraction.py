@@ -1,11 +1,18 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, overload
+from typing import TYPE_CHECKING, overload, Any
 if TYPE_CHECKING:
-    from typing import MutableMapping, Callable, Optional, Union
+    from typing import MutableMapping, Mapping, Callable, Optional, Union, Sequence, Iterable, Iterator
+    from concurrent.futures import Future
 
 from enum import IntFlag
 import re
+import os
+import time
+import hashlib
+from collections import deque, Counter
+from functools import partial
+from itertools import islice, chain
 
 
 class FeatureFlags(IntFlag):
@@ -15,9 +22,26 @@ class FeatureFlags(IntFlag):
     CODE_BLOCK = 8
     CODE_FENCE = 16
 
+class _LazyPattern:
+    # Compiles the pattern on first access then replaces itself on the owner
+    # class with the compiled pattern, so importing this module stays cheap.
+
+    def __init__(self, pattern: str, flags: int = 0) -> None:
+        self._pattern = pattern
+        self._flags = flags
+        self._name = ''
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = name
+
+    def __get__(self, instance: object, owner: Any) -> re.Pattern[str]:
+        compiled = re.compile(self._pattern, self._flags)
+        setattr(owner, self._name, compiled)
+        return compiled
+
 class RegexStaticNamespace:
-    code_block = re.compile(r"^(\t| {4,}).+", re.M)
-    code_outside_of_code_block = re.compile(r"""
+    code_block = _LazyPattern(r"^(\t| {4,}).+", re.M)
+    code_outside_of_code_block = _LazyPattern(r"""
 ^\ {0,3}(
     (function|filter|workflow|class|enum)\ *[a-z_][a-z0-9_-]*\ *\n?{
     |(if|switch)\ *\((?=.*\$).+\)\ *\n?{\ *
@@ -29,9 +53,75 @@ class RegexStaticNamespace:
     |\$[a-z_]\w*\ *[=\|]
 )
 """, re.I | re.M | re.X)
-    inline_code_lines = re.compile(r"^ {0,3}`(.*)`[\t ]*$", re.M)
-    consecutive_inline_code_lines = re.compile(r"^ {0,3}`(.*)`[\t ]*\n\n?`.*\n\n?`", re.M)
-    code_fence = re.compile(r"^```.*?\n(.*?)```", re.M | re.S)
+    # The `for` loop alternative of `code_outside_of_code_block` backtracks
+    # cubically on long lines with many semicolons, so it is checked in linear
+    # time by `_match_for_loop_header_tail` instead. See `match_code_outside_of_code_block`.
+    code_outside_of_code_block_except_for_loops = _LazyPattern(r"""
+^\ {0,3}(
+    (function|filter|workflow|class|enum)\ *[a-z_][a-z0-9_-]*\ *\n?{
+    |(if|switch)\ *\((?=.*\$).+\)\ *\n?{\ *
+    |foreach\ *\((?=.*\$)(?=.*in).+\)\ *\n?{
+    |param\ *\(
+    |process\ *\n?{
+    |(PS\ [A-Z]:\\[-\w\\]*>\ )?\w{3,}-\w{2,}\ (-?\w+|@?'|@?"|\$[a-z]|[A-Z]:\\|\|\ *\w)
+    |\$[a-z_]\w*\ *[=\|]
+)
+""", re.I | re.M | re.X)
+    for_loop_header = _LazyPattern(r"^ {0,3}for *\(", re.I | re.M)
+    for_loop_header_close = _LazyPattern(r"\) *\n?\{")
+    for_loop_header_operator = _LazyPattern(r"-\w\w\b")
+    inline_code_lines = _LazyPattern(r"^ {0,3}`(.*)`[\t ]*$", re.M)
+    inline_code_line = _LazyPattern(r" {0,3}`(.*)`[\t ]*")
+    consecutive_inline_code_lines = _LazyPattern(r"^ {0,3}`(.*)`[\t ]*\n\n?`.*\n\n?`", re.M)
+    code_fence = _LazyPattern(r"^```.*?\n(.*?)```", re.M | re.S)
+
+
+def _match_for_loop_header_tail(text: str, pos: int) -> bool:
+    # Linear time equivalent of `(?=[^;]*\$).*;(?=[^;]*-\w\w\b).*;.*\)\ *\n?{`
+    # matched at `pos`. The match needs two semicolons and a closing parenthesis
+    # on the current line, so each lookahead is confined to the current line too.
+    eol = text.find('\n', pos)
+    if eol < 0:
+        eol = len(text)
+
+    first_semicolon = text.find(';', pos, eol)
+    if first_semicolon < 0 or text.find('$', pos, first_semicolon) < 0:
+        return False
+
+    last_close = -1
+    for m in RegexStaticNamespace.for_loop_header_close.finditer(text, pos, eol + 2):
+        last_close = m.start()
+    if last_close < 0:
+        return False
+
+    semicolon = first_semicolon
+    while True:
+        next_semicolon = text.find(';', semicolon + 1, last_close)
+        if next_semicolon < 0:
+            return False
+        if RegexStaticNamespace.for_loop_header_operator.search(text, semicolon + 1, next_semicolon):
+            return True
+        semicolon = next_semicolon
+
+def match_code_outside_of_code_block(text: str, pos: int = 0) -> bool:
+    """Equivalent to `RegexStaticNamespace.code_outside_of_code_block.match(text, pos)`,
+    but runs in time linear in the length of the line at `pos`.
+    """
+    if RegexStaticNamespace.code_outside_of_code_block_except_for_loops.match(text, pos):
+        return True
+    m = RegexStaticNamespace.for_loop_header.match(text, pos)
+    return m is not None and _match_for_loop_header_tail(text, m.end())
+
+def search_code_outside_of_code_block(text: str) -> bool:
+    """Equivalent to `RegexStaticNamespace.code_outside_of_code_block.search(text)`,
+    but runs in time linear in the length of the text.
+    """
+    if RegexStaticNamespace.code_outside_of_code_block_except_for_loops.search(text):
+        return True
+    return any(
+        _match_for_loop_header_tail(text, m.end())
+        for m in RegexStaticNamespace.for_loop_header.finditer(text)
+    )
 
 
 feature_flags_registry: MutableMapping[int, Callable[[str], bool]] = {}
@@ -53,7 +143,7 @@ def _(text: str) -> bool:
 
 @register(FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK)
 def _(text: str) -> bool:
-    return bool(RegexStaticNamespace.code_outside_of_code_block.search(text))
+    return search_code_outside_of_code_block(text)
 
 @register(FeatureFlags.MULTILINE_INLINE_CODE)
 def _(text: str) -> bool:
@@ -66,7 +156,7 @@ def _(text: str) -> bool:
         # If it's just two consecutive lines of inline code then don't bother.
         return False
 
-    return bool(RegexStaticNamespace.code_outside_of_code_block.search(new_text))
+    return search_code_outside_of_code_block(new_text)
 
 @register(FeatureFlags.VERY_LONG_INLINE_CODE)
 def _(text: str) -> bool:
@@ -82,9 +172,348 @@ def _(text: str) -> bool:
     return bool(RegexStaticNamespace.code_fence.search(text))
 
 
-def extract_features(text: str) -> int:
+# Prefilters are cheap substring checks that return false only when the
+# detector for the flag cannot possibly fire, letting its regex be skipped.
+feature_flags_prefilter_registry: MutableMapping[int, Callable[[str], bool]] = {}
+
+def register_prefilter(flag: int) -> Callable[[Callable[[str], bool]], None]:
+    def decorator(func: Callable[[str], bool]) -> None:
+        feature_flags_prefilter_registry[flag] = func
+    return decorator
+
+
+@register_prefilter(FeatureFlags.CODE_BLOCK)
+def _(text: str) -> bool:
+    return '\t' in text or '    ' in text
+
+@register_prefilter(FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK)
+def _(text: str) -> bool:
+    # Every alternative needs a `$`, a Verb-Noun hyphen, a brace, or `param(`.
+    return '$' in text or '-' in text or '{' in text or '(' in text
+
+@register_prefilter(FeatureFlags.MULTILINE_INLINE_CODE)
+def _(text: str) -> bool:
+    return '`' in text
+
+@register_prefilter(FeatureFlags.VERY_LONG_INLINE_CODE)
+def _(text: str) -> bool:
+    return '`' in text
+
+@register_prefilter(FeatureFlags.CODE_FENCE)
+def _(text: str) -> bool:
+    return '```' in text
+
+
+class PrefilterStatistics:
+    def __init__(self) -> None:
+        self.checked: Counter[int] = Counter()
+        self.rejected: Counter[int] = Counter()
+
+    def hit_rate(self, flag: Optional[int] = None) -> float:
+        """The fraction of prefilter checks that let a detector be skipped."""
+        if flag is None:
+            checked = sum(self.checked.values())
+            rejected = sum(self.rejected.values())
+        else:
+            checked = self.checked[flag]
+            rejected = self.rejected[flag]
+        return rejected / checked if checked else 0.
+
+    def reset(self) -> None:
+        self.checked.clear()
+        self.rejected.clear()
+
+prefilter_statistics = PrefilterStatistics()
+
+def run_detector(flag: int, text: str, *, prefilter: bool = True) -> bool:
+    func = feature_flags_registry[flag]
+    if prefilter:
+        prefilter_func = feature_flags_prefilter_registry.get(flag)
+        if prefilter_func is not None:
+            prefilter_statistics.checked[flag] += 1
+            if not prefilter_func(text):
+                prefilter_statistics.rejected[flag] += 1
+                return False
+    return func(text)
+
+
+class CPUBudgetExceeded(Exception):
+    pass
+
+def extract_features(text: str, *, cpu_budget: Optional[float] = None, prefilter: bool = True) -> int:
+    """Evaluate every registered detector against the text.
+
+    Detectors whose prefilter rules them out are skipped unless `prefilter` is false.
+
+    If `cpu_budget` is given, `CPUBudgetExceeded` is raised when more than that
+    many seconds of process CPU time are spent. The budget is checked between
+    detectors. Every detector runs in linear time so the overshoot is bounded.
+    """
+    deadline = None if cpu_budget is None else time.process_time() + cpu_budget
     b = 0
-    for flag, func in feature_flags_registry.items():
-        if func(text):
+    for flag in feature_flags_registry:
+        if deadline is not None and time.process_time() > deadline:
+            raise CPUBudgetExceeded
+        if run_detector(flag, text, prefilter=prefilter):
             b |= flag
     return b
+
+
+class LazyFeatureFlags:
+    """The feature flags of a text, where each detector is evaluated on first access.
+
+    Use `test` to query individual flags, or `int()` to evaluate the remaining
+    detectors and get the full bitmask as `extract_features` would return it.
+
+    If `cpu_budget` is given, `CPUBudgetExceeded` is raised when a detector is
+    about to be evaluated after the detectors evaluated so far have used more
+    than that many seconds of process CPU time. Only the detectors' own time
+    is counted, so work done by other code between accesses doesn't use up
+    the budget.
+    """
+
+    def __init__(self,
+        text: str,
+        *,
+        cpu_budget: Optional[float] = None,
+        prefilter: bool = True,
+    ) -> None:
+        self.text: str = text
+        self._prefilter: bool = prefilter
+        self._cpu_budget: Optional[float] = cpu_budget
+        self._cpu_time: float = 0.
+        self._known: dict[int, bool] = {}
+
+    def __int__(self) -> int:
+        for flag in feature_flags_registry:
+            self.test(flag)
+        return self.known_mask
+
+    def test(self, flag: int) -> bool:
+        v = self._known.get(flag)
+        if v is None:
+            if self._cpu_budget is not None and self._cpu_time > self._cpu_budget:
+                raise CPUBudgetExceeded
+            start = time.process_time()
+            try:
+                v = self._known[flag] = run_detector(flag, self.text, prefilter=self._prefilter)
+            finally:
+                self._cpu_time += time.process_time() - start
+        return v
+
+    @property
+    def known_mask(self) -> int:
+        """The bitmask of the flags evaluated so far that are set."""
+        b = 0
+        for flag, v in self._known.items():
+            if v:
+                b |= flag
+        return int(b)
+
+    @property
+    def evaluated_count(self) -> int:
+        return len(self._known)
+
+    @property
+    def avoided_count(self) -> int:
+        return len(feature_flags_registry) - len(self._known)
+
+
+def _could_start_code(line: str) -> bool:
+    # Every alternative of `code_outside_of_code_block` begins with up to
+    # three spaces followed by a word character or a `$`.
+    k = len(line) - len(line.lstrip(' '))
+    if k > 3 or k == len(line):
+        return False
+    c = line[k]
+    return c == '$' or c == '_' or c.isalnum()
+
+def _next_backtick_line(lines: Sequence[str], k: int) -> int:
+    # Mirrors the `\n\n?`` step of `consecutive_inline_code_lines`:
+    # a single blank line may be skipped before the backtick.
+    last = len(lines) - 1
+    if k > last:
+        return -1
+    if lines[k] == '' and k < last:
+        k += 1
+    return k if lines[k].startswith('`') else -1
+
+def extract_features_line_scan(text: str, *, cpu_budget: Optional[float] = None) -> int:
+    """Compute the same bitmask as `extract_features` in a single walk over the lines.
+
+    Each line is classified once (indented block line, fence line, inline code
+    line, candidate code line) and all the feature flags are derived from
+    those classifications. Unlike the registry detectors, the multiline inline
+    code check does not build a substituted copy of the whole text.
+
+    If `cpu_budget` is given, `CPUBudgetExceeded` is raised when more than that
+    many seconds of process CPU time are spent. The budget is checked per line.
+    """
+    deadline = None if cpu_budget is None else time.process_time() + cpu_budget
+    lines = text.split('\n')
+    last = len(lines) - 1
+    match_inline = RegexStaticNamespace.inline_code_line.fullmatch
+
+    code_block = False
+    code_fence = False
+    fence_opened = False
+    very_long_inline_code = False
+    code_line = -1
+    inline_code: dict[int, str] = {}
+
+    pos = 0
+    for i, line in enumerate(lines):
+        if deadline is not None and time.process_time() > deadline:
+            raise CPUBudgetExceeded
+
+        if not code_block and (
+            (line.startswith('\t') and len(line) > 1)
+            or (line.startswith('    ') and len(line) > 4)
+        ):
+            code_block = True
+
+        if code_line < 0 and _could_start_code(line) and match_code_outside_of_code_block(text, pos):
+            code_line = i
+
+        if '`' in line:
+            if fence_opened:
+                if not code_fence and '```' in line:
+                    code_fence = True
+            elif i < last and line.startswith('```'):
+                fence_opened = True
+
+            m = match_inline(line)
+            if m:
+                content = m[1]
+                inline_code[i] = content
+                if len(content) > 120:
+                    very_long_inline_code = True
+
+        pos += len(line) + 1
+
+    b = 0
+    if code_block:
+        b |= FeatureFlags.CODE_BLOCK
+    if code_line >= 0:
+        b |= FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK
+    if very_long_inline_code:
+        b |= FeatureFlags.VERY_LONG_INLINE_CODE
+    if code_fence:
+        b |= FeatureFlags.CODE_FENCE
+    if _has_multiline_inline_code(lines, inline_code, code_line, deadline):
+        b |= FeatureFlags.MULTILINE_INLINE_CODE
+    return b
+
+def _has_multiline_inline_code(
+    lines: Sequence[str],
+    inline_code: Mapping[int, str],
+    code_line: int,
+    deadline: Optional[float],
+) -> bool:
+    if len(inline_code) < 3:
+        return False
+
+    last = len(lines) - 1
+    for i in inline_code:
+        if i == last:
+            continue
+        j = _next_backtick_line(lines, i + 1)
+        if j < 0 or j == last:
+            continue
+        if _next_backtick_line(lines, j + 1) >= 0:
+            break
+    else:
+        return False
+
+    # Evaluate `code_outside_of_code_block` as though the inline code lines
+    # had been unwrapped. A match at the start of a line can only see that
+    # line and the one after it, so lines unaffected by the unwrapping keep
+    # the verdict found during the line scan.
+    for k, line in enumerate(lines):
+        if deadline is not None and time.process_time() > deadline:
+            raise CPUBudgetExceeded
+
+        affected = k in inline_code or (k + 1) in inline_code
+        if not affected:
+            if code_line < 0 or k < code_line:
+                continue
+            if k == code_line:
+                return True
+        line = inline_code.get(k, line)
+        if not _could_start_code(line):
+            continue
+        if k < last:
+            line += '\n' + inline_code.get(k + 1, lines[k + 1])
+        if match_code_outside_of_code_block(line):
+            return True
+    return False
+
+
+extraction_engines: Mapping[str, Callable[[str], int]] = {
+    'registry': extract_features,
+    'registry_unfiltered': partial(extract_features, prefilter=False),
+    'line_scan': extract_features_line_scan,
+}
+
+
+def digest_text(text: str) -> bytes:
+    """Return a 16 byte digest of the text, used to tell if a submission body has
+    changed since its features were last extracted.
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+def _initialize_worker() -> None:
+    # Make sure the patterns are compiled once, up front, in each worker process.
+    for name, v in list(vars(RegexStaticNamespace).items()):
+        if isinstance(v, _LazyPattern):
+            getattr(RegexStaticNamespace, name)
+
+def _extract_features_chunk(engine: Callable[[str], int], texts: Sequence[str]) -> list[int]:
+    return [engine(text) for text in texts]
+
+def extract_features_many(
+    texts: Iterable[str],
+    *,
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+    in_process_threshold: int = 256,
+    engine: Callable[[str], int] = extract_features,
+) -> Iterator[int]:
+    """Extract the features of many texts, yielding the bitmasks in input order.
+
+    Work is fanned out over a process pool in chunks of `chunksize` texts.
+    If fewer than `in_process_threshold` texts are given, or `workers` is 1,
+    the texts are processed in the current process instead. The input is
+    consumed lazily so arbitrarily long iterables can be streamed through.
+
+    The `engine` must be picklable, e.g. one of `extraction_engines`.
+    """
+    it = iter(texts)
+    head = list(islice(it, in_process_threshold))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if len(head) < in_process_threshold or workers <= 1:
+        yield from map(engine, head)
+        yield from map(engine, it)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    max_pending = 2 * workers
+    pending: deque[Future[list[int]]] = deque()
+    remaining = chain(head, it)
+    with ProcessPoolExecutor(workers, initializer=_initialize_worker) as executor:
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    chunk = list(islice(remaining, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(_extract_features_chunk, engine, chunk))
+                if not pending:
+                    break
+                yield from pending.popleft().result()
+        finally:
+            for fut in pending:
+                fut.cancel()
@@ -0,0 +1,46 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Generic, TypeVar, Hashable
+if TYPE_CHECKING:
+    from typing import AsyncIterator
+
+import asyncio
+from contextlib import asynccontextmanager
+
+K = TypeVar('K', bound=Hashable)
+
+
+class KeyedLock(Generic[K]):
+    """A lock per key, so that work on the same key runs one at a time while
+    work on different keys runs concurrently.
+
+    Waiters on a key are granted the lock in the order they asked for it.
+    A key's lock is dropped once nobody holds or waits on it.
+    """
+
+    def __init__(self) -> None:
+        self._locks: dict[K, asyncio.Lock] = {}
+        self._users: dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def locked(self, key: K) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: K) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+            self._users[key] = 0
+        self._users[key] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._locks[key]
+                del self._users[key]
@@ -1,15 +1,14 @@
 
 from __future__ import annotations
-from typing import Optional
+from typing import Optional, Union, Callable, Mapping
 
 from io import StringIO
 from string import Template
-from urllib.parse import urlencode
+from urllib.parse import urlencode, quote_plus
 from enum import Enum, auto
+from functools import lru_cache
 
-from redditwarp.util.base_conversion import to_base36
-
-from .feature_extraction import FeatureFlags
+from .feature_extraction import FeatureFlags, LazyFeatureFlags
 
 
 class MessagePartsStaticNamepace:
@@ -94,7 +93,7 @@ def build_pester_message_part(
     determiner: MessageDeterminer,
     enlightened: bool,
     thing: str,
-    completed_in: int,
+    completed_in: Union[int, str],
 ) -> str:
     sign = '-'
     symbol = '\N{CROSS MARK}'
@@ -131,8 +130,20 @@ def build_enlightenment_message_part(fraction: tuple[int, int]) -> str:
     [AboutRedditFormatting]: [{}] {} {}
 '''.format(bar, '%d/%d' % fraction, symbol)
 
+def _to_base36(n: int) -> str:
+    # Avoids importing RedditWarp, which is slow, just for `to_base36`.
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    s = ''
+    while True:
+        n, r = divmod(n, 36)
+        s = digits[r] + s
+        if not n:
+            return s
+
 def build_footer_message_part(submission_id: int, username: str) -> str:
-    submission_id36 = to_base36(submission_id)
+    return _build_footer_message_part(_to_base36(submission_id), username)
+
+def _build_footer_message_part(submission_id36: str, username: str) -> str:
     message = '''\
 Click ‘send’ to immediately delete the bot’s comment.
 
@@ -163,29 +174,43 @@ class MessageDeterminer(Enum):
     MULTILINE_INLINE_CODE = auto()
     VERY_LONG_INLINE_CODE = auto()
 
-def get_message_determiner(feature_flags: int) -> Optional[MessageDeterminer]:
-    if (feature_flags & (mask := FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK | FeatureFlags.CODE_FENCE)) == mask:
-        return MessageDeterminer.CODE_FENCES
-    elif (feature_flags & (mask := FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK | FeatureFlags.CODE_BLOCK)) == mask:
-        return MessageDeterminer.SOME_CODE_OUTSIDE_OF_CODE_BLOCK
-    elif feature_flags & FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK:
+def get_message_determiner(feature_flags: Union[int, LazyFeatureFlags]) -> Optional[MessageDeterminer]:
+    # Flags are queried in priority order so that, given a `LazyFeatureFlags`,
+    # only the detectors that can affect the outcome are evaluated.
+    test: Callable[[int], bool]
+    if isinstance(feature_flags, LazyFeatureFlags):
+        test = feature_flags.test
+    else:
+        test = lambda flag: bool(feature_flags & flag)  # noqa: E731
+
+    if test(FeatureFlags.CODE_OUTSIDE_OF_CODE_BLOCK):
+        if test(FeatureFlags.CODE_FENCE):
+            return MessageDeterminer.CODE_FENCES
+        if test(FeatureFlags.CODE_BLOCK):
+            return MessageDeterminer.SOME_CODE_OUTSIDE_OF_CODE_BLOCK
         return MessageDeterminer.CODE_OUTSIDE_OF_CODE_BLOCK
-    elif feature_flags & FeatureFlags.MULTILINE_INLINE_CODE:
+    elif test(FeatureFlags.MULTILINE_INLINE_CODE):
         return MessageDeterminer.MULTILINE_INLINE_CODE
-    elif feature_flags & FeatureFlags.VERY_LONG_INLINE_CODE:
+    elif test(FeatureFlags.VERY_LONG_INLINE_CODE):
         return MessageDeterminer.VERY_LONG_INLINE_CODE
     return None
 
 
-def build_message(
+def compose_message(
     *,
     determiner: MessageDeterminer,
     enlightened: bool,
-    submission_id: int,
+    submission_id36: str,
     permalink_path: str,
+    thing: str,
     username: str,
-    submission_body_len: int,
+    completed_in: str,
 ) -> str:
+    """Assemble a message from its parts.
+
+    This does all the work of rendering a message from scratch. The bot uses
+    `build_message`, which renders each message skeleton only once.
+    """
     sio = StringIO()
     template = {
         MessageDeterminer.CODE_FENCES: MessagePartsStaticNamepace.code_fences_template,
@@ -201,8 +226,8 @@ def build_message(
     sio.write(build_pester_message_part(
         determiner=determiner,
         enlightened=enlightened,
-        thing=permalink_path.strip('/').rpartition('/')[-1],
-        completed_in=submission_body_len,
+        thing=thing,
+        completed_in=completed_in,
     ))
     '''
     fraction = {
@@ -218,5 +243,66 @@ def build_message(
     '''#'''
 
     sio.write(MessagePartsStaticNamepace.thematic_break)
-    sio.write(build_footer_message_part(submission_id, username))
+    sio.write(_build_footer_message_part(submission_id36, username))
     return sio.getvalue()
+
+
+class MessageSkeleton:
+    """A message rendered with placeholders in place of its per-submission fields.
+
+    `literals` and `fields` interleave: the message is `literals[0]`, then the
+    value of `fields[0]`, then `literals[1]`, and so on.
+    """
+
+    field_names = ('submission_id36', 'permalink_path', 'thing', 'completed_in')
+
+    def __init__(self, literals: tuple[str, ...], fields: tuple[str, ...]) -> None:
+        self.literals = literals
+        self.fields = fields
+
+    @classmethod
+    def compile(cls, *, determiner: MessageDeterminer, enlightened: bool, username: str) -> MessageSkeleton:
+        placeholders = {name: f'\0{name}\0' for name in cls.field_names}
+        text = compose_message(
+            determiner=determiner,
+            enlightened=enlightened,
+            username=username,
+            **placeholders,
+        )
+        # The deletion link URL-encodes the submission ID. Base36 digits are
+        # left as is by `quote_plus`, so the placeholder can stand unencoded.
+        for placeholder in placeholders.values():
+            text = text.replace(quote_plus(placeholder), placeholder)
+
+        chunks = text.split('\0')
+        return cls(tuple(chunks[0::2]), tuple(chunks[1::2]))
+
+    def render(self, values: Mapping[str, str]) -> str:
+        literals = self.literals
+        parts = [literals[0]]
+        for i, name in enumerate(self.fields, 1):
+            parts.append(values[name])
+            parts.append(literals[i])
+        return ''.join(parts)
+
+@lru_cache(maxsize=None)
+def get_message_skeleton(determiner: MessageDeterminer, enlightened: bool, username: str) -> MessageSkeleton:
+    return MessageSkeleton.compile(determiner=determiner, enlightened=enlightened, username=username)
+
+
+def build_message(
+    *,
+    determiner: MessageDeterminer,
+    enlightened: bool,
+    submission_id: int,
+    permalink_path: str,
+    username: str,
+    submission_body_len: int,
+) -> str:
+    skeleton = get_message_skeleton(determiner, enlightened, username)
+    return skeleton.render({
+        'submission_id36': _to_base36(submission_id),
+        'permalink_path': permalink_path,
+        'thing': permalink_path.strip('/').rpartition('/')[-1],
+        'completed_in': str(submission_body_len),
+    })
@@ -1,12 +1,21 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 if TYPE_CHECKING:
+    from typing import Iterable
     import sqlalchemy.engine.row
 
+from dataclasses import fields
+from itertools import starmap
+
+from ..database_schema import record_table
 from ..models.record import Record
 
-def load_record(row: sqlalchemy.engine.row.Row) -> Record:
+# The record table's columns in `Record` field order. Rows selected with
+# these columns can be loaded positionally by `load_records`.
+record_columns = tuple(record_table.c[f.name] for f in fields(Record))
+
+def load_record(row: sqlalchemy.engine.row.Row[Any]) -> Record:
     return Record(
         id=row.id,
         feature_flags=row.feature_flags,
@@ -15,4 +24,12 @@ def load_record(row: sqlalchemy.engine.row.Row) -> Record:
         target_submission_created_ut=row.target_submission_created_ut,
         target_submission_author_name=row.target_submission_author_name,
         bot_comment_id=row.bot_comment_id,
+        target_submission_edited_ut=row.target_submission_edited_ut,
+        target_submission_body_digest=row.target_submission_body_digest,
+        bot_comment_body_digest=row.bot_comment_body_digest,
+        next_recheck_ut=row.next_recheck_ut,
     )
+
+def load_records(rows: Iterable[sqlalchemy.engine.row.Row[Any]]) -> list[Record]:
+    """Load a chunk of rows selected with `record_columns`."""
+    return list(starmap(Record, rows))
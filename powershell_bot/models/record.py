@@ -5,6 +5,21 @@ from dataclasses import dataclass
 
 @dataclass
 class Record:
+    # Recheck sweeps can load a great many records, so skip the per-instance dict.
+    __slots__ = (
+        'id',
+        'feature_flags',
+        'recheck',
+        'target_submission_id',
+        'target_submission_created_ut',
+        'target_submission_author_name',
+        'bot_comment_id',
+        'target_submission_edited_ut',
+        'target_submission_body_digest',
+        'bot_comment_body_digest',
+        'next_recheck_ut',
+    )
+
     id: int
     feature_flags: int
     recheck: bool
@@ -12,3 +27,7 @@ class Record:
     target_submission_created_ut: int
     target_submission_author_name: str
     bot_comment_id: Optional[int]
+    target_submission_edited_ut: Optional[int]
+    target_submission_body_digest: Optional[bytes]
+    bot_comment_body_digest: Optional[bytes]
+    next_recheck_ut: Optional[int]
@@ -0,0 +1,13 @@
+
+from typing import Any
+
+from dataclasses import dataclass
+
+@dataclass
+class WorkItem:
+    id: int
+    queue_name: str
+    payload: Any
+    enqueued_ut: int
+    # The number of times the item has been delivered, including this time.
+    attempts: int
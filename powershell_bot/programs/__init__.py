@@ -1,6 +0,0 @@
-
-from . import bot  # noqa: F401
-from . import test_one  # noqa: F401
-from . import test_many  # noqa: F401
-from . import test_string  # noqa: F401
-from . import process_targets  # noqa: F401
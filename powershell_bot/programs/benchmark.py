@@ -0,0 +1,26 @@
+from typing import Optional
+
+import sys
+import json
+
+from ..benchmarking.suite import run_benchmarks
+
+def invoke(n: int, seed: int, repeat: int, output: Optional[str]) -> None:
+    results = run_benchmarks(n=n, seed=seed, repeat=repeat)
+
+    for name, seconds in results['timings'].items():
+        print(f"{name:<60}{seconds * 1e6:>12.2f} µs/post", file=sys.stderr)
+    for name, rate in results['throughput'].items():
+        print(f"{name:<60}{rate:>12.0f} posts/s", file=sys.stderr)
+    for name, rate in results['prefilter_hit_rates'].items():
+        print(f"{'prefilter_hit_rate.' + name:<60}{rate:>12.1%}", file=sys.stderr)
+
+    s = json.dumps(results, indent=2)
+    if output is None:
+        print(s)
+    else:
+        with open(output, 'w') as fh:
+            print(s, file=fh)
+
+def run_invoke(n: int, seed: int, repeat: int, output: Optional[str]) -> None:
+    invoke(n, seed, repeat, output)
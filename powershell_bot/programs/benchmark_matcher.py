@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import time
+
+from ..feature_extraction import RegexStaticNamespace, search_code_outside_of_code_block
+from ..corpus_generation import generate_adversarial_texts
+
+def invoke(sizes: list[int], give_up_after: float) -> None:
+    print(f"{'input':<22}{'size':>8}{'backtracking (s)':>20}{'linear (s)':>14}")
+
+    given_up: set[str] = set()
+    for size in sizes:
+        for name, text in generate_adversarial_texts(size).items():
+            backtracking = 'skipped'
+            if name not in given_up:
+                t0 = time.perf_counter()
+                RegexStaticNamespace.code_outside_of_code_block.search(text)
+                elapsed = time.perf_counter() - t0
+                backtracking = f'{elapsed:.6f}'
+                if elapsed > give_up_after:
+                    given_up.add(name)
+
+            t0 = time.perf_counter()
+            search_code_outside_of_code_block(text)
+            linear = f'{time.perf_counter() - t0:.6f}'
+
+            print(f"{name:<22}{len(text):>8}{backtracking:>20}{linear:>14}")
+
+def run_invoke(sizes: list[int], give_up_after: float) -> None:
+    invoke(sizes, give_up_after)
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from ..benchmarking.records import generate_record_rows, measure_record_loading
+
+def invoke(sizes: list[int], repeat: int) -> None:
+    for n in sizes:
+        rows = generate_record_rows(n)
+        for result in measure_record_loading(rows, repeat):
+            print(
+                f"{result.loader:<14}{result.n:>10}"
+                f"{result.seconds * 1e9 / result.n:>10.0f} ns/record"
+                f"{result.bytes_per_record:>10.0f} B/record"
+            )
+
+def run_invoke(sizes: list[int], repeat: int) -> None:
+    invoke(sizes, repeat)
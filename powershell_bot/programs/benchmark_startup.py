@@ -0,0 +1,17 @@
+from typing import Optional
+
+from ..benchmarking.startup import subcommand_modules, measure_import_time
+
+def invoke(repeat: int, top: int, subcommand: Optional[str]) -> None:
+    names = list(subcommand_modules) if subcommand is None else [subcommand]
+    for name in names:
+        module = subcommand_modules[name]
+        us, report = measure_import_time(module, repeat)
+        print(f"{name:<20}{us / 1000:>10.1f} ms  ({module})")
+
+        if top:
+            for entry in sorted(report, key=lambda e: e.self_us, reverse=True)[:top]:
+                print(f"{'':<4}{entry.self_us / 1000:>10.1f} ms self  {entry.module}")
+
+def run_invoke(repeat: int, top: int, subcommand: Optional[str]) -> None:
+    invoke(repeat, top, subcommand)
@@ -2,13 +2,11 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING, Callable, Awaitable
 if TYPE_CHECKING:
-    from redditwarp.models.message_ASYNC import CommentMessage
     from ...lib.online_presence_indicator import OnlinePresenceIndicator
 
 import sys
 import os
 import asyncio
-import asyncio.queues
 import logging
 import logging.handlers
 from pathlib import Path
@@ -19,15 +17,21 @@ from contextlib import suppress
 from functools import partial
 
 import redditwarp.ASYNC
-from sqlalchemy.ext.asyncio import create_async_engine as create_engine
+from ...database_engine import create_engine, get_pool_statistics
 
 from ...__about__ import version_string
 from ...dal.service import Service
+from ...dal.record_cache import RecordCache
+from ...dal.work_queue import WorkQueue
+from ...dal.stream_checkpoint import StreamCheckpoint
 from ...lib.online_presence_indicator import create_online_presence_indicator_factory
 from .submission_replying_component import get_submission_replying_component
 from .submission_rechecking_component import get_submission_rechecking_component
 from .comment_replying_component import get_comment_replying_component
 from .inbox_monitoring_component import get_inbox_monitoring_component
+from .record_archiving_component import get_record_archiving_component
+from .api_budget import ApiBudgetScheduler
+from .snap_in_host import SnapInHost
 
 
 async def invoke(*, debug: bool = False) -> None:
@@ -78,6 +82,14 @@ async def invoke(*, debug: bool = False) -> None:
     advanced_comment_replying_enabled = section.getboolean('advanced_comment_replying_enabled', False)
     username = section['username']
     password = section['password']
+    feature_extraction_cpu_budget = section.getfloat('feature_extraction_cpu_budget', .5)
+    record_cache_size = section.getint('record_cache_size', 1024)
+    archive_after_days = section.getfloat('archive_after_days', 30)
+    recheck_concurrency = section.getint('recheck_concurrency', 4)
+    inbox_concurrency = section.getint('inbox_concurrency', 4)
+    comment_replying_queue_size = section.getint('comment_replying_queue_size', 100)
+    snap_in_workers = section.getint('snap_in_workers', 2)
+    snap_in_timeout = section.getfloat('snap_in_timeout', 30)
 
     logger.info('=== PROGRAM START ===')
     logger.info('Version: %s', version_string)
@@ -92,8 +104,23 @@ async def invoke(*, debug: bool = False) -> None:
 
     engine = create_engine(database_url)
     haven: set[asyncio.Task[None]] = set()
-    service = Service(engine=engine, haven=haven)
-    comment_replying_queue: asyncio.queues.Queue[CommentMessage] = asyncio.queues.Queue(5)
+    record_cache = None
+    if record_cache_size > 0:
+        record_cache = RecordCache(max_size=record_cache_size)
+    service = Service(engine=engine, haven=haven, record_cache=record_cache, logger=logger)
+    comment_replying_queue = WorkQueue(engine=engine, name='comment_replying', max_size=comment_replying_queue_size)
+    submission_stream_checkpoint = StreamCheckpoint(engine=engine, name='submissions')
+    inbox_stream_checkpoint = StreamCheckpoint(engine=engine, name='inbox')
+    api_budget = ApiBudgetScheduler(client)
+    snap_in_host = None
+    if advanced_comment_replying_enabled:
+        snap_in_host = SnapInHost(
+            logger=logger,
+            username=username,
+            database_url=database_url,
+            max_workers=snap_in_workers,
+            timeout=snap_in_timeout,
+        )
     presence_factory = await create_online_presence_indicator_factory(username, password)
 
     async def do_online_presence_indicator_forever(factory: Callable[[], Awaitable[OnlinePresenceIndicator]]) -> None:
@@ -107,28 +134,51 @@ async def invoke(*, debug: bool = False) -> None:
                 logger.error('Online presence websocket error', exc_info=True)
                 await asyncio.sleep(60)
 
+    async def log_pool_statistics_forever() -> None:
+        while True:
+            await asyncio.sleep(10 * 60)
+            logger.debug('Database connection pool statistics: %s', get_pool_statistics(engine))
+            if record_cache is not None:
+                logger.debug('Record cache statistics: %s', record_cache.get_statistics())
+            logger.debug(
+                'API budget: %s remaining at %.2f requests per second; by class: %s',
+                api_budget.remaining,
+                api_budget.rate,
+                api_budget.get_statistics(),
+            )
+            logger.debug('Comment replying queue statistics: %s', comment_replying_queue.get_statistics())
+
     aws = [
         do_online_presence_indicator_forever(presence_factory),
+        log_pool_statistics_forever(),
         get_submission_replying_component(
             client=client,
             logger=logger,
             target_subreddit_name=target_subreddit_name,
             username=username,
             service=service,
+            feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+            api_budget=api_budget,
+            checkpoint=submission_stream_checkpoint,
         ),
         get_submission_rechecking_component(
             client=client,
             logger=logger,
             username=username,
             service=service,
+            feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+            recheck_concurrency=recheck_concurrency,
+            api_budget=api_budget,
         ),
         get_comment_replying_component(
             client=client,
             logger=logger,
             service=service,
-            advanced_comment_replying_enabled=advanced_comment_replying_enabled,
             username=username,
             comment_replying_queue=comment_replying_queue,
+            feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+            api_budget=api_budget,
+            snap_in_host=snap_in_host,
         ),
         get_inbox_monitoring_component(
             client=client,
@@ -137,8 +187,17 @@ async def invoke(*, debug: bool = False) -> None:
             username=username,
             advanced_comment_replying_enabled=advanced_comment_replying_enabled,
             comment_replying_queue=comment_replying_queue,
+            api_budget=api_budget,
+            checkpoint=inbox_stream_checkpoint,
+            inbox_concurrency=inbox_concurrency,
         ),
     ]
+    if archive_after_days > 0:
+        aws.append(get_record_archiving_component(
+            logger=logger,
+            service=service,
+            archive_after_days=archive_after_days,
+        ))
     futs = [asyncio.ensure_future(aw) for aw in aws]
 
     termination = loop.create_future()
@@ -150,35 +209,55 @@ async def invoke(*, debug: bool = False) -> None:
 
     logger.info('Bot is now live')
 
-    for aw in asyncio.as_completed({termination, *futs}):
-        try:
-            await aw
-        except Exception:
-            logger.critical('Unhandled exception encountered', exc_info=True)
-            raise
-        if termination.done():
-            break
-
-    logger.info('Termination sequence starting')
-
-    async def termination_coro_fn() -> None:
-        for fut in futs:
-            fut.cancel()
-        for fut in futs:
-            with suppress(asyncio.CancelledError):
-                await fut
-
-        while haven:
-            await haven.pop()
-
-        await engine.dispose()
-
-    ACCEPTABLE_TERMINATION_DELAY = 5
-    termination_task = asyncio.create_task(termination_coro_fn())
-    _done, pending = await asyncio.wait({termination_task}, timeout=ACCEPTABLE_TERMINATION_DELAY)
-    if pending:
-        logger.warning('Termination is taking longer than expected')
-    await termination_task
+    # The termination sequence runs however the bot stops, so that queued
+    # database writes aren't lost.
+    try:
+        for aw in asyncio.as_completed({termination, *futs}):
+            try:
+                await aw
+            except Exception:
+                logger.critical('Unhandled exception encountered', exc_info=True)
+                raise
+            if termination.done():
+                break
+
+    finally:
+        logger.info('Termination sequence starting')
+
+        async def termination_coro_fn() -> None:
+            for fut in futs:
+                fut.cancel()
+            for fut in futs:
+                with suppress(asyncio.CancelledError, Exception):
+                    await fut
+
+            while haven:
+                with suppress(Exception):
+                    await haven.pop()
+
+            if snap_in_host is not None:
+                await snap_in_host.close()
+
+            logger.info('Flushing %d pending database writes', service.pending_write_count)
+            try:
+                await service.flush()
+            except Exception:
+                logger.error('Failed to flush %d database writes', service.pending_write_count, exc_info=True)
+
+            for checkpoint in (submission_stream_checkpoint, inbox_stream_checkpoint):
+                try:
+                    await checkpoint.save()
+                except Exception:
+                    logger.error('Failed to save the %s stream checkpoint', checkpoint.name, exc_info=True)
+
+            await engine.dispose()
+
+        ACCEPTABLE_TERMINATION_DELAY = 5
+        termination_task = asyncio.create_task(termination_coro_fn())
+        _done, pending = await asyncio.wait({termination_task}, timeout=ACCEPTABLE_TERMINATION_DELAY)
+        if pending:
+            logger.warning('Termination is taking longer than expected')
+        await termination_task
 
     logger.info('=== PROGRAM END ===')
 
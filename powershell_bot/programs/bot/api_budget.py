@@ -0,0 +1,181 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+if TYPE_CHECKING:
+    from typing import Mapping, AsyncIterator
+    import redditwarp.ASYNC
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from collections import Counter
+from contextlib import asynccontextmanager, suppress
+
+from redditwarp.util.token_bucket import TokenBucket
+
+
+class ApiPriority(IntEnum):
+    """Classes of requests to the Reddit API, most urgent first."""
+    NEW_SUBMISSION_REPLY = 0
+    DELETION_REQUEST = 1
+    RECHECK_EDIT = 2
+    BULK_RECHECK = 3
+    COMMENT_REPLY = 4
+
+# Bulk rechecks and comment replies share a rank, so neither can starve the other.
+_ranks: Mapping[ApiPriority, int] = {
+    ApiPriority.NEW_SUBMISSION_REPLY: 0,
+    ApiPriority.DELETION_REQUEST: 1,
+    ApiPriority.RECHECK_EDIT: 2,
+    ApiPriority.BULK_RECHECK: 3,
+    ApiPriority.COMMENT_REPLY: 3,
+}
+
+
+class ApiBudgetScheduler:
+    """Share the account's Reddit API budget between the bot's components.
+
+    Every request the bot makes goes through `request()`, which waits its
+    turn: requests are granted in priority order, then in order of arrival.
+
+    The pace is set by the `x-ratelimit-remaining` and `x-ratelimit-reset`
+    headers of Reddit's responses, so the requests the submission and inbox
+    streams make on their own are accounted for too. Until a response has
+    been seen, and after each window resets, `rate` requests per second are
+    granted. When `reserve` or fewer requests remain in the window, only
+    new-submission replies and deletion requests are granted, and once none
+    remain, nothing is granted until the window resets.
+    """
+
+    def __init__(
+        self,
+        client: redditwarp.ASYNC.Client,
+        *,
+        rate: float = 1.,
+        burst: float = 10.,
+        min_rate: float = .1,
+        max_rate: float = 10.,
+        reserve: float = 10.,
+    ) -> None:
+        self.client = client
+        self.default_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.reserve = reserve
+        self.remaining: Optional[float] = None
+        self._reset_at = 0.
+        self._bucket = TokenBucket(burst, rate)
+        self._waiters: list[tuple[int, int, ApiPriority, asyncio.Future[None]]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task[None]] = None
+        self._queue_depths: Counter[ApiPriority] = Counter()
+        self._granted: Counter[ApiPriority] = Counter()
+        self._wait_totals: dict[ApiPriority, float] = dict.fromkeys(ApiPriority, 0.)
+        self._wait_maxima: dict[ApiPriority, float] = dict.fromkeys(ApiPriority, 0.)
+
+    @property
+    def rate(self) -> float:
+        return self._bucket.rate
+
+    @asynccontextmanager
+    async def request(self, priority: ApiPriority) -> AsyncIterator[None]:
+        """Wait for a turn to make one request, then make it in the `async with` body."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            response = self.client.http.last.response
+            if response is not None:
+                self.update_from_headers(response.headers)
+
+    async def acquire(self, priority: ApiPriority) -> None:
+        start = time.monotonic()
+        if not self._waiters and self._may_grant(priority) and self._bucket.try_consume(1):
+            self._record_grant(priority, 0.)
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_ranks[priority], next(self._seq), priority, fut))
+        self._queue_depths[priority] += 1
+        self._wakeup.set()
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await fut
+        finally:
+            self._queue_depths[priority] -= 1
+        self._record_grant(priority, time.monotonic() - start)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Set the pace from the rate limit headers of a Reddit response."""
+        try:
+            remaining = float(headers['x-ratelimit-remaining'])
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            return
+        self.remaining = remaining
+        self._reset_at = time.monotonic() + reset
+        # Spread what's left of the window evenly over the time until it resets.
+        rate = remaining / max(reset, 1)
+        self._bucket.rate = min(self.max_rate, max(self.min_rate, rate))
+
+    def get_statistics(self) -> dict[str, dict[str, float]]:
+        statistics = {}
+        for priority in ApiPriority:
+            granted = self._granted[priority]
+            statistics[priority.name.lower()] = {
+                'queue_depth': self._queue_depths[priority],
+                'granted': granted,
+                'mean_wait': self._wait_totals[priority] / granted if granted else 0.,
+                'max_wait': self._wait_maxima[priority],
+            }
+        return statistics
+
+    def _may_grant(self, priority: ApiPriority) -> bool:
+        if self.remaining is not None and time.monotonic() >= self._reset_at:
+            # A new window has started. Its budget is unknown until the next response.
+            self.remaining = None
+            self._bucket.rate = self.default_rate
+        if self.remaining is None:
+            return True
+        if _ranks[priority] <= _ranks[ApiPriority.DELETION_REQUEST]:
+            return self.remaining > 0
+        return self.remaining > self.reserve
+
+    def _get_delay(self, priority: ApiPriority) -> float:
+        if not self._may_grant(priority):
+            return self._reset_at - time.monotonic()
+        return self._bucket.get_cooldown(1)
+
+    def _record_grant(self, priority: ApiPriority, wait: float) -> None:
+        if self.remaining is not None:
+            self.remaining -= 1
+        self._granted[priority] += 1
+        self._wait_totals[priority] += wait
+        self._wait_maxima[priority] = max(wait, self._wait_maxima[priority])
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._waiters:
+                _rank, _seq, priority, fut = self._waiters[0]
+                if fut.done():
+                    # The waiting task was cancelled.
+                    heapq.heappop(self._waiters)
+                    continue
+
+                delay = self._get_delay(priority)
+                if delay > 0:
+                    # Wake early if a more urgent request arrives.
+                    self._wakeup.clear()
+                    with suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue
+
+                self._bucket.consume(1)
+                heapq.heappop(self._waiters)
+                fut.set_result(None)
+        finally:
+            self._dispatcher = None
@@ -5,15 +5,20 @@ if TYPE_CHECKING:
     import redditwarp.ASYNC
     import logging
     from ...dal.service import Service
+    from ...dal.work_queue import WorkQueue
+    from .snap_in_host import SnapInHost
+    from .api_budget import ApiBudgetScheduler
 
-import asyncio
 import re
+import asyncio
+from collections import Counter
 
 from redditwarp.util.base_conversion import to_base36
-from redditwarp.util.token_bucket import TokenBucket
 from redditwarp.models.message_ASYNC import CommentMessage
+from redditwarp.model_loaders.message_ASYNC import load_comment_message
 
 from .submission_rechecking_component import process_recheck_record
+from .api_budget import ApiPriority
 
 
 delete_command_regex = re.compile(r"^!delete +([a-z0-9]{1,12}) *$", re.I)
@@ -26,9 +31,11 @@ def get_comment_replying_component(
     client: redditwarp.ASYNC.Client,
     logger: logging.Logger,
     service: Service,
-    advanced_comment_replying_enabled: bool,
     username: str,
-    comment_replying_queue: asyncio.queues.Queue[CommentMessage],
+    comment_replying_queue: WorkQueue,
+    feature_extraction_cpu_budget: Optional[float],
+    api_budget: ApiBudgetScheduler,
+    snap_in_host: Optional[SnapInHost],
 ) -> Awaitable[None]:
     async def get_advanced_comment_reply(
         *,
@@ -38,8 +45,8 @@ def get_comment_replying_component(
     ) -> Optional[str]:
         raise Exception
 
-    if advanced_comment_replying_enabled:
-        from powershell_bot_snapins.advanced_comment_replying import get_advanced_comment_reply as _get_advanced_comment_reply  # type: ignore
+    if snap_in_host is not None:
+        _snap_in_host = snap_in_host
 
         async def get_advanced_comment_reply(  # noqa: F811
             *,
@@ -47,18 +54,26 @@ def get_comment_replying_component(
             service: Service,
             mesg: CommentMessage,
         ) -> Optional[str]:
-            return await _get_advanced_comment_reply(logger=logger, service=service, mesg=mesg)
+            # The snap-in runs in a worker process with its own logger and service.
+            return await _snap_in_host.get_advanced_comment_reply(mesg.d)
 
     async def comment_replying_queue_comsumer() -> None:
-        tb = TokenBucket(5, 1)
+        recheck_counter: Counter[str] = Counter()
+        # Failed replies are retried after this many seconds, until the queue
+        # gives up on them.
+        retry_delay = 60
 
         while True:
-            mesg = await comment_replying_queue.get()
             try:
-                await asyncio.sleep(tb.get_cooldown(1))
-                tb.consume(1)
-
-                logger.info('Generating comment reply for comment: %s', to_base36(mesg.comment.id))
+                item = await comment_replying_queue.get()
+            except Exception:
+                logger.error('Failed to take an item from the comment replying queue', exc_info=True)
+                await asyncio.sleep(retry_delay)
+                continue
+            done = False
+            try:
+                mesg = load_comment_message(item.payload, client)
+                logger.info('Generating comment reply for comment: %s (attempt %d)', to_base36(mesg.comment.id), item.attempts)
 
                 record = await service.get_record_by_submission_id(mesg.submission.id)
                 if record is not None:
@@ -68,7 +83,11 @@ def get_comment_replying_component(
                         record=record,
                         username=username,
                         service=service,
+                        feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+                        counter=recheck_counter,
+                        api_budget=api_budget,
                     )
+                    logger.debug('Edits suppressed by comment-triggered rechecks so far: %d', recheck_counter['edits_suppressed'])
 
                 try:
                     reply_text = await get_advanced_comment_reply(logger=logger, service=service, mesg=mesg)
@@ -78,17 +97,31 @@ def get_comment_replying_component(
 
                 if reply_text is None:
                     logger.info('No advanced comment reply text generated')
+                    done = True
                     continue
 
                 try:
-                    await client.p.comment.reply(mesg.comment.id, reply_text + "\n\n&thinsp;^^^(*Beep-boop.*)")
+                    async with api_budget.request(ApiPriority.COMMENT_REPLY):
+                        await client.p.comment.reply(mesg.comment.id, reply_text + "\n\n&thinsp;^^^(*Beep-boop.*)")
                 except Exception:
                     logger.error('Failed to reply to comment after NLP text generation', exc_info=True)
                     continue
 
                 logger.info('Made NLP reply to comment: %s', to_base36(mesg.comment.id))
+                done = True
+
+            except Exception:
+                logger.error('Error processing queued comment', exc_info=True)
 
             finally:
-                comment_replying_queue.task_done()
+                # If this fails, the item is delivered again once its
+                # visibility timeout runs out.
+                try:
+                    if done:
+                        await comment_replying_queue.ack(item)
+                    else:
+                        await comment_replying_queue.retry(item, retry_delay)
+                except Exception:
+                    logger.error('Failed to update queued comment', exc_info=True)
 
     return comment_replying_queue_comsumer()
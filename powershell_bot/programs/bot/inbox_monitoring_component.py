@@ -1,18 +1,22 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, Awaitable
+from typing import TYPE_CHECKING, Awaitable, Optional
 if TYPE_CHECKING:
     from redditwarp.models.message_ASYNC import MailboxMessage
     import redditwarp.ASYNC
     import logging
     from ...dal.service import Service
+    from ...dal.work_queue import WorkQueue
+    from ...dal.stream_checkpoint import StreamCheckpoint
+    from .api_budget import ApiBudgetScheduler
 
 import asyncio
+import time
 import random
 
 import redditwarp
 from redditwarp.models.message import CommentMessageCause
-from redditwarp.streaming.makers.message_ASYNC import create_inbox_message_stream
+from redditwarp.streaming.makers.message_ASYNC import create_inbox_message_stream, get_inbox_message_stream_paginator
 from redditwarp.util.base_conversion import to_base36
 from redditwarp.models.message_ASYNC import ComposedMessage, CommentMessage
 
@@ -21,6 +25,9 @@ from .comment_replying_component import (
     good_being_regex,
     delete_command_regex,
 )
+from .api_budget import ApiPriority
+from .stream_resumption import run_resumable_stream
+from ...lib.keyed_lock import KeyedLock
 
 
 def get_inbox_monitoring_component(
@@ -30,12 +37,24 @@ def get_inbox_monitoring_component(
     service: Service,
     username: str,
     advanced_comment_replying_enabled: bool,
-    comment_replying_queue: asyncio.queues.Queue[CommentMessage],
+    comment_replying_queue: WorkQueue,
+    api_budget: ApiBudgetScheduler,
+    checkpoint: StreamCheckpoint,
+    inbox_concurrency: int = 1,
 ) -> Awaitable[None]:
     inbox_message_stream = create_inbox_message_stream(client)
 
-    @inbox_message_stream.output.attach
-    async def _(mesg: MailboxMessage) -> None:
+    def get_target_submission_id(mesg: MailboxMessage) -> Optional[int]:
+        if isinstance(mesg, ComposedMessage):
+            m = delete_command_regex.match(mesg.subject)
+            if m is None:
+                return None
+            return int(m[1], 36)
+        if isinstance(mesg, CommentMessage):
+            return mesg.submission.id
+        return None
+
+    async def handle_mailbox_message(mesg: MailboxMessage) -> None:
         logger.info('Mailbox message received')
 
         if isinstance(mesg, ComposedMessage):
@@ -45,11 +64,12 @@ def get_inbox_monitoring_component(
             if m:
                 logger.info('Ping')
                 try:
-                    await client.p.message.send(
-                        mesg.author_name,
-                        're: ' + mesg.subject,
-                        'pong',
-                    )
+                    async with api_budget.request(ApiPriority.COMMENT_REPLY):
+                        await client.p.message.send(
+                            mesg.author_name,
+                            're: ' + mesg.subject,
+                            'pong',
+                        )
                 except Exception:
                     logger.error('Failed to return ping: %s', to_base36(mesg.id), exc_info=True)
                 return
@@ -85,7 +105,8 @@ def get_inbox_monitoring_component(
                 return
 
             try:
-                tree_node = await client.p.comment_tree.fetch(record.target_submission_id, bot_comment_id)
+                async with api_budget.request(ApiPriority.DELETION_REQUEST):
+                    tree_node = await client.p.comment_tree.fetch(record.target_submission_id, bot_comment_id)
             except redditwarp.exceptions.RejectedResultException:
                 logger.info("The comment doesn't appear to exist anymore")
                 return
@@ -99,7 +120,8 @@ def get_inbox_monitoring_component(
                 return
 
             try:
-                await client.p.comment.delete(bot_comment_id)
+                async with api_budget.request(ApiPriority.DELETION_REQUEST):
+                    await client.p.comment.delete(bot_comment_id)
             except Exception:
                 logger.error('Failed to delete bot comment: %s', to_base36(bot_comment_id), exc_info=True)
                 return
@@ -124,7 +146,8 @@ def get_inbox_monitoring_component(
                 logger.info('Replying to comment: %s', mesg.comment.id)
 
                 try:
-                    await client.p.comment.reply(mesg.comment.id, "Good human.\n\n&thinsp;^^^(*Beep-boop.*)")
+                    async with api_budget.request(ApiPriority.COMMENT_REPLY):
+                        await client.p.comment.reply(mesg.comment.id, "Good human.\n\n&thinsp;^^^(*Beep-boop.*)")
                 except Exception:
                     logger.error('Failed to reply to comment', exc_info=True)
                     return
@@ -135,11 +158,78 @@ def get_inbox_monitoring_component(
                 if len(mesg.comment.body) > 110:
                     logger.info('Comment body is too long to reply to')
                     return
-                if not comment_replying_queue.full():
-                    comment_replying_queue.put_nowait(mesg)
+                # Wait a while for room, holding up the inbox, before giving up.
+                if not await comment_replying_queue.enqueue(mesg.d, timeout=30):
+                    logger.warning('Comment replying queue is full. Dropping comment: %s', to_base36(mesg.comment.id))
+
+    # Messages are handled concurrently, up to `inbox_concurrency` at a time,
+    # except that messages about the same submission are handled one after
+    # another, in the order they were received.
+    handler_slots = asyncio.Semaphore(inbox_concurrency)
+    handler_tasks: set[asyncio.Task[None]] = set()
+    submission_locks: KeyedLock[int] = KeyedLock()
+    handled_count = 0
+    total_latency = 0.
+    max_latency = 0.
+
+    async def handle_mailbox_message_in_turn(mesg: MailboxMessage, received_at: float) -> None:
+        nonlocal handled_count, total_latency, max_latency
+        target_submission_id = get_target_submission_id(mesg)
+        try:
+            if target_submission_id is None:
+                await handle_mailbox_message(mesg)
+            else:
+                async with submission_locks.hold(target_submission_id):
+                    await handle_mailbox_message(mesg)
+        except Exception:
+            logger.error('Error handling mailbox message', exc_info=True)
+        finally:
+            checkpoint.complete(mesg.d['name'])
+            latency = time.monotonic() - received_at
+            handled_count += 1
+            total_latency += latency
+            max_latency = max(latency, max_latency)
+            logger.debug(
+                'Mailbox message handled in %.2fs (%d handled, mean %.2fs, max %.2fs)',
+                latency,
+                handled_count,
+                total_latency / handled_count,
+                max_latency,
+            )
+
+    @inbox_message_stream.output.attach
+    async def _(mesg: MailboxMessage) -> None:
+        if not checkpoint.begin(mesg.d['name'], int(mesg.d['created_utc'])):
+            return
+        received_at = time.monotonic()
+        # Hold up the stream while all handlers are busy.
+        await handler_slots.acquire()
+        task = asyncio.create_task(handle_mailbox_message_in_turn(mesg, received_at))
+        handler_tasks.add(task)
+        task.add_done_callback(handler_tasks.discard)
+        task.add_done_callback(lambda _: handler_slots.release())
 
     @inbox_message_stream.error.attach
     async def _(error: Exception) -> None:
         logger.info('Error from inbox stream error hook', exc_info=error)
 
-    return inbox_message_stream
+    async def inbox_monitoring_job() -> None:
+        try:
+            await run_resumable_stream(
+                inbox_message_stream,
+                checkpoint=checkpoint,
+                catch_up_paginator=get_inbox_message_stream_paginator(client),
+                get_created_ut=lambda mesg: int(mesg.d['created_utc']),
+                logger=logger,
+                api_budget=api_budget,
+                priority=ApiPriority.DELETION_REQUEST,
+                # Unlike submissions, handled messages aren't recorded in the
+                # database, so the checkpoint is what stops a restarted bot
+                # from replying to a message twice.
+                checkpoint_interval=0,
+            )
+        finally:
+            for task in handler_tasks:
+                task.cancel()
+
+    return inbox_monitoring_job()
@@ -0,0 +1,42 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Awaitable
+if TYPE_CHECKING:
+    import logging
+    from ...dal.service import Service
+
+import asyncio
+import time
+
+
+def get_record_archiving_component(
+    *,
+    logger: logging.Logger,
+    service: Service,
+    archive_after_days: float,
+) -> Awaitable[None]:
+    async def record_archiving_job() -> None:
+        poll_interval = 60 * 60
+        batch_size = 500
+        # Yield the database to the other components between batches.
+        batch_pause = 1.
+
+        while True:
+            created_before_ut = int(time.time() - archive_after_days * 24 * 60 * 60)
+            total = 0
+            while True:
+                try:
+                    n = await service.archive_records(created_before_ut, batch_size)
+                except Exception:
+                    logger.error('Error archiving records', exc_info=True)
+                    break
+                total += n
+                if n < batch_size:
+                    break
+                await asyncio.sleep(batch_pause)
+
+            if total:
+                logger.info('Archived %d records', total)
+
+            await asyncio.sleep(poll_interval)
+
+    return record_archiving_job()
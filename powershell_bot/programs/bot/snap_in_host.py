@@ -0,0 +1,206 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional
+if TYPE_CHECKING:
+    from typing import Mapping
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+    from multiprocessing.queues import Queue
+
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import signal
+import traceback
+
+
+class SnapInError(Exception):
+    pass
+
+class SnapInTimeout(SnapInError):
+    pass
+
+class SnapInCrashed(SnapInError):
+    pass
+
+
+def _snap_in_worker_main(
+    conn: Connection,
+    log_queue: Queue[logging.LogRecord],
+    logger_name: str,
+    logger_level: int,
+    username: str,
+    database_url: str,
+) -> None:
+    # The parent process handles termination.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(logger_level)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    import redditwarp.ASYNC
+    from redditwarp.model_loaders.message_ASYNC import load_comment_message
+    from ...database_engine import create_engine
+    from ...dal.service import Service
+    from powershell_bot_snapins.advanced_comment_replying import get_advanced_comment_reply  # type: ignore
+
+    client = redditwarp.ASYNC.Client.from_praw_config(username)
+    haven: set[asyncio.Task[None]] = set()
+    service = Service(engine=create_engine(database_url), haven=haven, logger=logger)
+
+    async def get_reply(d: Mapping[str, Any]) -> Optional[str]:
+        mesg = load_comment_message(d, client)
+        try:
+            return await get_advanced_comment_reply(logger=logger, service=service, mesg=mesg)
+        finally:
+            await service.flush()
+
+    loop = asyncio.new_event_loop()
+    while True:
+        try:
+            d = conn.recv()
+        except EOFError:
+            break
+        try:
+            reply_text = loop.run_until_complete(get_reply(d))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+        else:
+            conn.send((True, reply_text))
+
+
+class _Worker:
+    def __init__(self, process: BaseProcess, conn: Connection) -> None:
+        self.process = process
+        self.conn = conn
+        self.call_count = 0
+
+
+class SnapInHost:
+    """Run the advanced comment replying snap-in in worker processes, so that
+    however long it takes, the event loop stays responsive.
+
+    At most `max_workers` calls run at a time; further calls wait their turn.
+    A call that takes longer than `timeout` seconds raises `SnapInTimeout`
+    and its worker is killed. A worker that dies mid-call raises
+    `SnapInCrashed`. Either way a new worker is started for the next call.
+    Workers are also replaced after `max_calls_per_worker` calls, in case
+    the snap-in leaks memory. Workers are started ahead of time, so that
+    their start-up doesn't count against a call's deadline.
+
+    Each worker has its own Reddit client and database connections, made
+    from `username` and `database_url`, and its log records are passed on
+    to `logger`.
+
+    The snap-in is imported here too, before any worker is started, so that
+    a snap-in that can't be imported stops the bot at startup with a
+    `SnapInError`.
+    """
+
+    def __init__(self,
+        *,
+        logger: logging.Logger,
+        username: str,
+        database_url: str,
+        max_workers: int = 2,
+        timeout: float = 30.,
+        max_calls_per_worker: int = 500,
+    ) -> None:
+        self.logger = logger
+        self.username = username
+        self.database_url = database_url
+        self.timeout = timeout
+        self.max_calls_per_worker = max_calls_per_worker
+        try:
+            import powershell_bot_snapins.advanced_comment_replying  # type: ignore  # noqa: F401
+        except Exception as e:
+            raise SnapInError('the advanced comment replying snap-in could not be imported') from e
+        # Forking would copy the event loop and open connections into the worker.
+        self._context = multiprocessing.get_context('spawn')
+        self._log_queue: Queue[logging.LogRecord] = self._context.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, *logger.handlers, respect_handler_level=True)
+        self._log_listener.start()
+        self._slots = asyncio.Semaphore(max_workers)
+        self._idle_workers: list[_Worker] = [self._start_worker() for _ in range(max_workers)]
+        self._busy_workers: set[_Worker] = set()
+
+    async def get_advanced_comment_reply(self, d: Mapping[str, Any]) -> Optional[str]:
+        """Call the snap-in for the comment message whose raw data is `d`."""
+        async with self._slots:
+            worker = self._idle_workers.pop()
+            self._busy_workers.add(worker)
+            try:
+                worker.conn.send(d)
+                try:
+                    ok, value = await asyncio.wait_for(self._receive(worker.conn), self.timeout)
+                except asyncio.TimeoutError:
+                    await self._replace_worker(worker)
+                    raise SnapInTimeout(f'snap-in call took longer than {self.timeout} seconds') from None
+                except (EOFError, OSError):
+                    await self._replace_worker(worker)
+                    raise SnapInCrashed(f'snap-in worker exited with code {worker.process.exitcode}') from None
+                except BaseException:
+                    await self._replace_worker(worker)
+                    raise
+            finally:
+                self._busy_workers.discard(worker)
+
+            worker.call_count += 1
+            if worker.call_count >= self.max_calls_per_worker:
+                await self._replace_worker(worker)
+            else:
+                self._idle_workers.append(worker)
+
+        if not ok:
+            raise SnapInError('snap-in call failed:\n' + value)
+        return value
+
+    async def close(self) -> None:
+        workers = self._idle_workers + list(self._busy_workers)
+        self._idle_workers.clear()
+        self._busy_workers.clear()
+        for worker in workers:
+            await self._stop_worker(worker)
+        self._log_listener.stop()
+
+    def _start_worker(self) -> _Worker:
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_snap_in_worker_main,
+            args=(child_conn, self._log_queue, self.logger.name, self.logger.getEffectiveLevel(), self.username, self.database_url),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self.logger.info('Started snap-in worker process: %d', process.pid)
+        return _Worker(process, conn)
+
+    async def _replace_worker(self, worker: _Worker) -> None:
+        await self._stop_worker(worker)
+        self._idle_workers.append(self._start_worker())
+
+    async def _stop_worker(self, worker: _Worker) -> None:
+        worker.conn.close()
+        worker.process.kill()
+        await asyncio.get_running_loop().run_in_executor(None, worker.process.join)
+        self.logger.info('Stopped snap-in worker process: %d', worker.process.pid)
+
+    @staticmethod
+    async def _receive(conn: Connection) -> Any:
+        loop = asyncio.get_running_loop()
+        readable: asyncio.Future[None] = loop.create_future()
+        fd = conn.fileno()
+
+        def on_readable() -> None:
+            if not readable.done():
+                readable.set_result(None)
+
+        loop.add_reader(fd, on_readable)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        return conn.recv()
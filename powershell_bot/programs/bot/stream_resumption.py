@@ -0,0 +1,145 @@
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+if TYPE_CHECKING:
+    import logging
+    from redditwarp.streaming.stream_ASYNC import IStandardStreamEventSubject
+    from redditwarp.pagination.async_paginator import CursorAsyncPaginator
+    from ...dal.stream_checkpoint import StreamCheckpoint
+    from .api_budget import ApiBudgetScheduler, ApiPriority
+
+import asyncio
+import time
+from contextlib import suppress
+
+T = TypeVar('T')
+
+
+async def wait_until_live(stream: IStandardStreamEventSubject[Any]) -> None:
+    """Drive a stream through its first fetch, after which it outputs new items.
+
+    The first fetch only marks the items already in the listing as seen. The
+    stream yields zero once it's done and sleep durations while it's failing.
+    """
+    while (delay := await stream.__anext__()) != 0:
+        await asyncio.sleep(delay)
+
+async def fetch_missed_items(
+    paginator: CursorAsyncPaginator[T],
+    *,
+    since_ut: int,
+    get_created_ut: Callable[[T], int],
+    api_budget: ApiBudgetScheduler,
+    priority: ApiPriority,
+    max_count: int = 1000,
+) -> list[T]:
+    """Page through a newest-first listing for the items created at or after
+    `since_ut`, and return them oldest first.
+
+    Reddit listings go back 1000 items at most.
+    """
+    page_size = 100
+    paginator.limit = page_size
+    items: list[T] = []
+    while len(items) < max_count:
+        async with api_budget.request(priority):
+            page = await paginator.fetch()
+        for obj in page:
+            if get_created_ut(obj) < since_ut:
+                items.reverse()
+                return items
+            items.append(obj)
+        if len(page) < page_size:
+            break
+    items.reverse()
+    return items
+
+async def run_resumable_stream(
+    stream: IStandardStreamEventSubject[T],
+    *,
+    checkpoint: StreamCheckpoint,
+    catch_up_paginator: CursorAsyncPaginator[T],
+    get_created_ut: Callable[[T], int],
+    logger: logging.Logger,
+    api_budget: ApiBudgetScheduler,
+    priority: ApiPriority,
+    max_catch_up_age: float = 60 * 60 * 24,
+    checkpoint_interval: float = 30,
+    catch_up_retry_delay: float = 60,
+) -> None:
+    """Run a stream, picking up from where the last run left off.
+
+    A new stream only outputs items that arrive after it starts. Once the
+    stream is live, the items that arrived since the saved checkpoint (but
+    no more than `max_catch_up_age` seconds ago) are fetched and sent through
+    the stream's output hooks, concurrently with new items. The hooks report
+    items to the checkpoint, which also filters out items seen twice.
+
+    The checkpoint is held until the catch-up is done, so that a restart in
+    the meantime catches up on the same items again. If fetching the missed
+    items fails it is retried every `catch_up_retry_delay` seconds.
+
+    The checkpoint is saved `checkpoint_interval` seconds after it changes
+    (straight away if zero) and when the stream stops.
+    """
+    start = time.monotonic()
+    await checkpoint.load()
+    last_seen_ut = checkpoint.last_seen_ut
+    if last_seen_ut is not None:
+        checkpoint.hold()
+    await wait_until_live(stream)
+    logger.info('The %s stream is live %.1fs after starting', checkpoint.name, time.monotonic() - start)
+
+    async def catch_up(last_seen_ut: int) -> None:
+        since_ut = max(last_seen_ut, int(time.time() - max_catch_up_age))
+        catch_up_start = time.monotonic()
+        while True:
+            try:
+                items = await fetch_missed_items(
+                    catch_up_paginator,
+                    since_ut=since_ut,
+                    get_created_ut=get_created_ut,
+                    api_budget=api_budget,
+                    priority=priority,
+                )
+            except Exception:
+                logger.error('Failed to fetch the items missed by the %s stream', checkpoint.name, exc_info=True)
+                await asyncio.sleep(catch_up_retry_delay)
+                continue
+            break
+        for item in items:
+            try:
+                await stream.output(item)
+            except Exception:
+                logger.error('Error handling an item missed by the %s stream', checkpoint.name, exc_info=True)
+        checkpoint.release()
+        logger.info(
+            'Caught up on %d items in the %s stream since %d in %.1fs',
+            len(items),
+            checkpoint.name,
+            since_ut,
+            time.monotonic() - catch_up_start,
+        )
+
+    async def save_checkpoint_forever() -> None:
+        while True:
+            await checkpoint.wait_changed()
+            await asyncio.sleep(checkpoint_interval)
+            try:
+                await checkpoint.save()
+            except Exception:
+                logger.error('Failed to save the %s stream checkpoint', checkpoint.name, exc_info=True)
+                await asyncio.sleep(60)
+
+    tasks = [asyncio.create_task(save_checkpoint_forever())]
+    if last_seen_ut is None:
+        logger.info('No checkpoint for the %s stream. Nothing to catch up on', checkpoint.name)
+    else:
+        tasks.append(asyncio.create_task(catch_up(last_seen_ut)))
+    try:
+        await stream
+    finally:
+        for task in tasks:
+            task.cancel()
+        with suppress(Exception):
+            await checkpoint.save()
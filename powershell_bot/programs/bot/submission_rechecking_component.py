@@ -1,22 +1,43 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, Awaitable
+from typing import TYPE_CHECKING, Awaitable, Optional
 if TYPE_CHECKING:
     import redditwarp.ASYNC
+    from redditwarp.models.submission_ASYNC import Submission
     import logging
     from ...dal.service import Service
     from ...models.record import Record
+    from .api_budget import ApiBudgetScheduler
 
 import asyncio
 import time
 import random
+from collections import Counter
 
 from redditwarp.util.base_conversion import to_base36
 from redditwarp.models.submission_ASYNC import TextPost
 
 from ...message_building import get_message_determiner, build_message
-from ...feature_extraction import extract_features
+from ...feature_extraction import extract_features, CPUBudgetExceeded, digest_text
+from .api_budget import ApiPriority
 
+async def fetch_submissions(client: redditwarp.ASYNC.Client, submission_ids: list[int]) -> dict[int, Submission]:
+    """Fetch submissions by ID, up to 100 per request. IDs not found are left out."""
+    return {subm.id: subm async for subm in client.p.submission.bulk_fetch(submission_ids)}
+
+
+def get_recheck_interval(since_last_change: float) -> float:
+    """Return how long to wait before rechecking a submission, given the seconds
+    since it was created or last edited, whichever is later.
+
+    Edits cluster in the first minutes after posting (and after the bot
+    comments), so fresh submissions are rechecked every 30 seconds and the
+    interval grows steadily from there, up to 30 minutes.
+    """
+    min_interval = 30
+    max_interval = 30 * 60
+    growth_period = 5 * 60
+    return min(max_interval, min_interval * (1 + since_last_change / growth_period))
 
 async def process_recheck_record(
     *,
@@ -25,13 +46,42 @@ async def process_recheck_record(
     record: Record,
     username: str,
     service: Service,
+    feature_extraction_cpu_budget: Optional[float],
+    counter: Optional[Counter[str]] = None,
+    api_budget: ApiBudgetScheduler,
 ) -> bool:
     try:
-        subm = await client.p.submission.fetch(record.target_submission_id)
+        async with api_budget.request(ApiPriority.BULK_RECHECK):
+            subm = await client.p.submission.fetch(record.target_submission_id)
     except Exception:
         logger.error('Error fetching submission: %s', to_base36(record.target_submission_id), exc_info=True)
         return False
 
+    return await process_recheck_submission(
+        client=client,
+        logger=logger,
+        record=record,
+        subm=subm,
+        username=username,
+        service=service,
+        feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+        counter=counter,
+        api_budget=api_budget,
+    )
+
+async def process_recheck_submission(
+    *,
+    client: redditwarp.ASYNC.Client,
+    logger: logging.Logger,
+    record: Record,
+    subm: Submission,
+    username: str,
+    service: Service,
+    feature_extraction_cpu_budget: Optional[float],
+    counter: Optional[Counter[str]] = None,
+    api_budget: ApiBudgetScheduler,
+) -> bool:
+    """Recheck a record against its already fetched submission."""
     if not isinstance(subm, TextPost):
         logger.error('Recorded submission is not a text post: %s', subm.id36)
         return False
@@ -41,11 +91,31 @@ async def process_recheck_record(
         await service.deactivate_rechecking(record.id)
         return True
 
+    body_digest = digest_text(subm.body)
+    if (
+        # A record without a digest never had its features fully extracted.
+        record.target_submission_body_digest is not None
+        and subm.edited_ut == record.target_submission_edited_ut
+        and body_digest == record.target_submission_body_digest
+    ):
+        logger.debug('Submission unchanged since last check: %s', subm.id36)
+        if counter is not None:
+            counter['skipped'] += 1
+        return True
+    if counter is not None:
+        counter['rescanned'] += 1
+
     old_feature_flags = record.feature_flags
-    new_feature_flags = extract_features(subm.body)
+    try:
+        new_feature_flags = extract_features(subm.body, cpu_budget=feature_extraction_cpu_budget)
+    except CPUBudgetExceeded:
+        # Leave the record as it is rather than act on a partial verdict.
+        logger.warning('Feature extraction exceeded the CPU budget. Skipping submission: %s', subm.id36)
+        return True
 
     if new_feature_flags == old_feature_flags:
         logger.debug('No new changes in submission: %s', subm.id36)
+        await service.set_target_submission_snapshot(record.id, subm.edited_ut, body_digest)
         return True
     logger.info('New change detected in submission: %s', subm.id36)
 
@@ -67,29 +137,41 @@ async def process_recheck_record(
             username=username,
             submission_body_len=len(subm.body),
         )
+        message_digest = digest_text(message)
 
         bot_comment_id = record.bot_comment_id
         if bot_comment_id is None:
             logger.info('Preparing to reply to submission: %s', record.target_submission_id)
 
             try:
-                comm = await client.p.submission.reply(subm.id, message)
+                async with api_budget.request(ApiPriority.RECHECK_EDIT):
+                    comm = await client.p.submission.reply(subm.id, message)
             except Exception:
                 logger.error('Failed to reply to submission', exc_info=True)
                 return False
             logger.info('Created bot comment: %s', comm.id36)
 
-            await service.set_bot_comment_id(record.id, comm.id)
+            await service.set_bot_comment_id(record.id, comm.id, message_digest)
+
+        elif message_digest == record.bot_comment_body_digest:
+            # Don't spend a request on an edit that wouldn't change anything.
+            logger.info('Bot comment is already up to date: %s', to_base36(bot_comment_id))
+            if counter is not None:
+                counter['edits_suppressed'] += 1
 
         else:
             try:
-                await client.p.comment.edit_body(bot_comment_id, message)
+                async with api_budget.request(ApiPriority.RECHECK_EDIT):
+                    await client.p.comment.edit_body(bot_comment_id, message)
             except Exception:
                 logger.error('Unable to edit bot comment: %s', to_base36(bot_comment_id), exc_info=True)
                 return False
             logger.info('Updated bot comment: %s', to_base36(bot_comment_id))
 
+            await service.set_bot_comment_body_digest(record.id, message_digest)
+
     await service.set_feature_flags(record.id, new_feature_flags)
+    await service.set_target_submission_snapshot(record.id, subm.edited_ut, body_digest)
     return True
 
 
@@ -99,9 +181,15 @@ def get_submission_rechecking_component(
     logger: logging.Logger,
     username: str,
     service: Service,
+    feature_extraction_cpu_budget: Optional[float],
+    api_budget: ApiBudgetScheduler,
+    recheck_concurrency: int = 1,
 ) -> Awaitable[None]:
     async def recheck_submissions_monitor_job() -> None:
-        base_poll_interval = 30
+        # Each record has its own schedule (see `get_recheck_interval`), kept in
+        # the record table so that it survives restarts. Every poll rechecks
+        # only the records that are due.
+        base_poll_interval = 10
         max_poll_interval = 3 * 60
         jitter_factor = .4
         backoff_factor = 2
@@ -111,26 +199,121 @@ def get_submission_rechecking_component(
 
         failure_threshold = .5
 
+        # The most submissions Reddit returns in one info request.
+        fetch_batch_size = 100
+
+        # For reporting: the interval at which every record used to be rechecked.
+        flat_sweep_interval = 30
+        flat_sweep_rechecks = 0.
+        total_rechecks = 0
+        last_cycle_start: Optional[float] = None
+
         while True:
-            cycle_total_count = 0
-            cycle_error_count = 0
-
-            async for record in service.produce_rechecking_records():
-                if time.time() - record.target_submission_created_ut > forget_after:
-                    await service.deactivate_rechecking(record.id)
-                    continue
-
-                cycle_total_count += 1
-
-                v = await process_recheck_record(
-                    client=client,
-                    logger=logger,
-                    record=record,
-                    username=username,
-                    service=service,
-                )
-                if not v:
-                    cycle_error_count += 1
+            cycle_counter: Counter[str] = Counter()
+            cycle_start = time.monotonic()
+            now_ut = int(time.time())
+
+            expired_count = await service.expire_rechecking(int(time.time()) - forget_after)
+            if expired_count:
+                logger.debug('Stopped rechecking %d expired records', expired_count)
+
+            queue: asyncio.Queue[Optional[tuple[Record, Optional[Submission]]]] = asyncio.Queue(2 * recheck_concurrency)
+
+            async def fetch_and_enqueue(records: list[Record]) -> None:
+                cycle_counter['fetch_requests'] += 1
+                try:
+                    async with api_budget.request(ApiPriority.BULK_RECHECK):
+                        submissions = await fetch_submissions(client, [r.target_submission_id for r in records])
+                except Exception:
+                    logger.error('Error fetching a batch of %d submissions', len(records), exc_info=True)
+                    cycle_counter['total'] += len(records)
+                    cycle_counter['errors'] += len(records)
+                    return
+                for record in records:
+                    await queue.put((record, submissions.get(record.target_submission_id)))
+
+            async def produce() -> None:
+                batch: list[Record] = []
+                async for record in service.produce_rechecking_records(page_size=fetch_batch_size, due_ut=now_ut):
+                    batch.append(record)
+                    if len(batch) == fetch_batch_size:
+                        await fetch_and_enqueue(batch)
+                        batch = []
+                if batch:
+                    await fetch_and_enqueue(batch)
+                for _ in range(recheck_concurrency):
+                    await queue.put(None)
+
+            async def work() -> None:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    record, subm = item
+
+                    cycle_counter['total'] += 1
+                    if subm is None:
+                        # Reddit leaves out submissions it can't find at all, as
+                        # opposed to ones that were removed or deleted.
+                        logger.error('Recorded submission not found: %s', to_base36(record.target_submission_id))
+                        cycle_counter['missing'] += 1
+                        cycle_counter['errors'] += 1
+                        continue
+
+                    v = await process_recheck_submission(
+                        client=client,
+                        logger=logger,
+                        record=record,
+                        subm=subm,
+                        username=username,
+                        service=service,
+                        feature_extraction_cpu_budget=feature_extraction_cpu_budget,
+                        counter=cycle_counter,
+                        api_budget=api_budget,
+                    )
+                    if not v:
+                        cycle_counter['errors'] += 1
+                        continue
+
+                    last_change_ut = max(record.target_submission_created_ut, subm.edited_ut or 0)
+                    interval = get_recheck_interval(time.time() - last_change_ut)
+                    await service.set_next_recheck_ut(record.id, int(time.time() + interval))
+
+            active_count = await service.count_rechecking_records()
+
+            tasks = [asyncio.create_task(produce())]
+            tasks.extend(asyncio.create_task(work()) for _ in range(recheck_concurrency))
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            cycle_total_count = cycle_counter['total']
+            cycle_error_count = cycle_counter['errors']
+
+            if last_cycle_start is not None:
+                flat_sweep_rechecks += active_count * (cycle_start - last_cycle_start) / flat_sweep_interval
+            last_cycle_start = cycle_start
+            total_rechecks += cycle_total_count
+            logger.debug(
+                'Recheck sweep done in %.1fs: %d checked in %d fetch requests, %d errors (%d missing), %d skipped, %d rescanned, %d edits suppressed',
+                time.monotonic() - cycle_start,
+                cycle_total_count,
+                cycle_counter['fetch_requests'],
+                cycle_error_count,
+                cycle_counter['missing'],
+                cycle_counter['skipped'],
+                cycle_counter['rescanned'],
+                cycle_counter['edits_suppressed'],
+            )
+            logger.debug(
+                'Recheck scheduling: %d of %d records were due; %d fetches saved so far compared with a flat %ds sweep',
+                cycle_total_count,
+                active_count,
+                max(0, round(flat_sweep_rechecks) - total_rechecks),
+                flat_sweep_interval,
+            )
 
             successful = True
             if cycle_total_count:
@@ -1,18 +1,22 @@
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, Awaitable
+from typing import TYPE_CHECKING, Awaitable, Optional
 if TYPE_CHECKING:
     import logging
     import redditwarp.ASYNC
     from redditwarp.models.submission_ASYNC import Submission
     from ...dal.service import Service
+    from ...dal.stream_checkpoint import StreamCheckpoint
+    from .api_budget import ApiBudgetScheduler
 
 
-from redditwarp.streaming.makers.subreddit_ASYNC import create_submission_stream
+from redditwarp.streaming.makers.subreddit_ASYNC import create_submission_stream, get_submission_stream_paginator
 from redditwarp.models.submission_ASYNC import TextPost
 
 from ...message_building import get_message_determiner, build_message
-from ...feature_extraction import extract_features
+from ...feature_extraction import LazyFeatureFlags, CPUBudgetExceeded, digest_text
+from .api_budget import ApiPriority
+from .stream_resumption import run_resumable_stream
 
 
 def get_submission_replying_component(
@@ -22,21 +26,47 @@ def get_submission_replying_component(
     logger: logging.Logger,
     username: str,
     service: Service,
+    feature_extraction_cpu_budget: Optional[float],
+    api_budget: ApiBudgetScheduler,
+    checkpoint: StreamCheckpoint,
 ) -> Awaitable[None]:
     submission_stream = create_submission_stream(client, target_subreddit_name)
 
     @submission_stream.output.attach
     async def _(subm: Submission) -> None:
+        fullname = 't3_' + subm.id36
+        if not checkpoint.begin(fullname, subm.created_ut):
+            return
+        try:
+            await handle_submission(subm)
+        finally:
+            checkpoint.complete(fullname)
+
+    async def handle_submission(subm: Submission) -> None:
         logger.info('Found new submission: %s', subm.id36)
 
+        if await service.get_record_by_submission_id(subm.id) is not None:
+            # Handled by an earlier run, after its last saved checkpoint.
+            logger.info('Submission is already in the database')
+            return
+
         if not isinstance(subm, TextPost):
             logger.info('Submission is not a text post')
             return
 
-        b = extract_features(subm.body)
-        det = get_message_determiner(b)
+        flags = LazyFeatureFlags(subm.body, cpu_budget=feature_extraction_cpu_budget)
+        budget_exceeded = False
+        try:
+            det = get_message_determiner(flags)
+        except CPUBudgetExceeded:
+            # Stay quiet on submissions we can't analyse in time.
+            logger.warning('Feature extraction exceeded the CPU budget. Treating submission as OK')
+            budget_exceeded = True
+            det = None
+        logger.debug('Message determined with %d detector calls avoided', flags.avoided_count)
 
         bot_comment_id = None
+        bot_comment_body_digest = None
         if det is None:
             logger.info('Submission is OK')
         else:
@@ -50,12 +80,28 @@ def get_submission_replying_component(
                 submission_body_len=len(subm.body),
             )
             try:
-                comm = await client.p.submission.reply(subm.id, message)
+                async with api_budget.request(ApiPriority.NEW_SUBMISSION_REPLY):
+                    comm = await client.p.submission.reply(subm.id, message)
             except Exception:
                 logger.error('Failed to reply to submission', exc_info=True)
                 return
             logger.info('Created bot comment: %s', comm.id36)
             bot_comment_id = comm.id
+            bot_comment_body_digest = digest_text(message)
+
+        # The remaining detectors are only evaluated now, after any reply,
+        # because the record stores the full bitmask.
+        b = 0
+        if not budget_exceeded:
+            try:
+                b = int(flags)
+            except CPUBudgetExceeded:
+                b = flags.known_mask
+                budget_exceeded = True
+
+        # Without a body digest the next recheck extracts the features again
+        # instead of taking the partial bitmask as up to date.
+        body_digest = None if budget_exceeded else digest_text(subm.body)
 
         await service.add_record(
             feature_flags=b,
@@ -63,6 +109,9 @@ def get_submission_replying_component(
             target_submission_created_ut=subm.created_ut,
             target_submission_author_name=subm.author_display_name,
             bot_comment_id=bot_comment_id,
+            bot_comment_body_digest=bot_comment_body_digest,
+            target_submission_edited_ut=subm.edited_ut,
+            target_submission_body_digest=body_digest,
         )
 
         logger.info("Added submission to database: %s", subm.id36)
@@ -71,4 +120,12 @@ def get_submission_replying_component(
     async def _(error: Exception) -> None:
         logger.info('Error from submission stream error hook', exc_info=error)
 
-    return submission_stream
+    return run_resumable_stream(
+        submission_stream,
+        checkpoint=checkpoint,
+        catch_up_paginator=get_submission_stream_paginator(client, target_subreddit_name),
+        get_created_ut=lambda subm: subm.created_ut,
+        logger=logger,
+        api_budget=api_budget,
+        priority=ApiPriority.NEW_SUBMISSION_REPLY,
+    )
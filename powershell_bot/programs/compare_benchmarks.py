@@ -0,0 +1,22 @@
+import sys
+import json
+
+from ..benchmarking.comparison import compare_results, find_regressions
+
+def invoke(old_path: str, new_path: str, threshold: float) -> None:
+    with open(old_path) as fh:
+        old = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+
+    changes = compare_results(old, new)
+    for c in changes:
+        print(f"{c.name:<60}{c.old * 1e6:>12.2f}{c.new * 1e6:>12.2f} µs/post {c.ratio - 1:>+8.1%}")
+
+    regressions = find_regressions(changes, threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions over {threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+def run_invoke(old_path: str, new_path: str, threshold: float) -> None:
+    invoke(old_path, new_path, threshold)
@@ -1,5 +1,5 @@
 
-from typing import Iterable
+from typing import Iterable, Optional
 
 import sys
 import asyncio
@@ -7,14 +7,14 @@ from configparser import ConfigParser
 
 import redditwarp.ASYNC
 from redditwarp.models.submission_ASYNC import TextPost
-from sqlalchemy import insert
-from sqlalchemy.ext.asyncio import create_async_engine as create_engine
+from sqlalchemy.exc import IntegrityError
+from ..database_engine import create_engine
 
-from ..database_schema import record_table
-from ..feature_extraction import extract_features
+from ..dal.service import Service
+from ..feature_extraction import extract_features_many, digest_text
 from ..message_building import get_message_determiner, build_message
 
-async def invoke(submission_id36s: Iterable[str]) -> None:
+async def invoke(submission_id36s: Iterable[str], workers: Optional[int] = None) -> None:
     config = ConfigParser()
     config.read('powershell_bot.ini')
     section = config[config.default_section]
@@ -23,59 +23,78 @@ async def invoke(submission_id36s: Iterable[str]) -> None:
     target_subreddit_name = section['target_subreddit_name']
 
     engine = create_engine(database_url)
-
-    client = redditwarp.ASYNC.Client.from_praw_config(username)
-
-    for submission_id36 in submission_id36s:
-        subm = await client.p.submission.fetch(int(submission_id36, 36))
-
-        if subm.subreddit.name != target_subreddit_name:
-            print(
-                    ("Submission subreddit does not equal target subreddit: "
-                    f"{subm.subreddit.name!r} != {target_subreddit_name!r}"),
-                    file=sys.stderr)
-            continue
-
-        if not isinstance(subm, TextPost):
-            print('Submission is not a text post: ' + submission_id36, file=sys.stderr)
-            continue
-
-        b = extract_features(subm.body)
-        det = get_message_determiner(b)
-
-        if det is None:
-            print('Submission is OK')
-            continue
-
-        print('Preparing to reply to submission: ' + submission_id36, file=sys.stderr)
-
-        message = build_message(
-            determiner=det,
-            enlightened=False,
-            submission_id=subm.id,
-            permalink_path=subm.permalink_path,
-            username=username,
-            submission_body_len=len(subm.body),
-        )
-        try:
-            comm = await client.p.submission.reply(subm.id, message)
-        except Exception:
-            print('Failed to reply to submission: ' + submission_id36, file=sys.stderr)
-            continue
-
-        async with engine.connect() as conn:
-            await conn.execute(
-                insert(record_table),
-                {
-                    'feature_flags': b,
-                    'recheck': True,
-                    'target_submission_id': subm.id,
-                    'target_submission_created_ut': subm.created_ut,
-                    'target_submission_author_name': subm.author_display_name,
-                    'bot_comment_id': comm.id,
-                },
+    try:
+        client = redditwarp.ASYNC.Client.from_praw_config(username)
+        haven: set[asyncio.Task[None]] = set()
+        service = Service(engine=engine, haven=haven)
+
+        targets: list[TextPost] = []
+        for submission_id36 in submission_id36s:
+            submission_id = int(submission_id36, 36)
+
+            # Also finds submissions whose record has been archived.
+            if await service.get_record_by_submission_id(submission_id) is not None:
+                print('Submission is already in the database: ' + submission_id36, file=sys.stderr)
+                continue
+
+            subm = await client.p.submission.fetch(submission_id)
+
+            if subm.subreddit.name != target_subreddit_name:
+                print(
+                        ("Submission subreddit does not equal target subreddit: "
+                        f"{subm.subreddit.name!r} != {target_subreddit_name!r}"),
+                        file=sys.stderr)
+                continue
+
+            if not isinstance(subm, TextPost):
+                print('Submission is not a text post: ' + submission_id36, file=sys.stderr)
+                continue
+
+            targets.append(subm)
+
+        feature_flags_iter = extract_features_many((subm.body for subm in targets), workers=workers)
+        for subm, b in zip(targets, feature_flags_iter):
+            submission_id36 = subm.id36
+            det = get_message_determiner(b)
+
+            if det is None:
+                print('Submission is OK')
+                continue
+
+            print('Preparing to reply to submission: ' + submission_id36, file=sys.stderr)
+
+            message = build_message(
+                determiner=det,
+                enlightened=False,
+                submission_id=subm.id,
+                permalink_path=subm.permalink_path,
+                username=username,
+                submission_body_len=len(subm.body),
             )
-            await conn.commit()
-
-def run_invoke(submission_id36s: Iterable[str]) -> None:
-    asyncio.run(invoke(submission_id36s))
+            try:
+                comm = await client.p.submission.reply(subm.id, message)
+            except Exception:
+                print('Failed to reply to submission: ' + submission_id36, file=sys.stderr)
+                continue
+
+            try:
+                await service.add_record(
+                    feature_flags=b,
+                    target_submission_id=subm.id,
+                    target_submission_created_ut=subm.created_ut,
+                    target_submission_author_name=subm.author_display_name,
+                    bot_comment_id=comm.id,
+                    target_submission_edited_ut=subm.edited_ut,
+                    target_submission_body_digest=digest_text(subm.body),
+                    bot_comment_body_digest=digest_text(message),
+                )
+                await service.flush()
+            except IntegrityError:
+                # The bot added the submission in the meantime.
+                print('Submission was added to the database concurrently: ' + submission_id36, file=sys.stderr)
+    finally:
+        # Pooled connections would otherwise keep the process alive.
+        await engine.dispose()
+
+def run_invoke(submission_id36s: Iterable[str], workers: Optional[int] = None) -> None:
+    asyncio.run(invoke(submission_id36s, workers))
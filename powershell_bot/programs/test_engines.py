@@ -0,0 +1,36 @@
+import sys
+
+from ..feature_extraction import (
+    extraction_engines,
+    RegexStaticNamespace,
+    search_code_outside_of_code_block,
+    prefilter_statistics,
+)
+from ..corpus_generation import generate_corpus
+
+def invoke(n: int, seed: int) -> None:
+    reference_name, reference = next(iter(extraction_engines.items()))
+
+    mismatch_count = 0
+    for i, text in enumerate(generate_corpus(n, seed)):
+        expected = reference(text)
+        for name, engine in extraction_engines.items():
+            actual = engine(text)
+            if actual != expected:
+                mismatch_count += 1
+                print(f"Mismatch on corpus item {i}: {reference_name}={expected} {name}={actual}", file=sys.stderr)
+                print(repr(text), file=sys.stderr)
+
+        expected_code = bool(RegexStaticNamespace.code_outside_of_code_block.search(text))
+        if search_code_outside_of_code_block(text) != expected_code:
+            mismatch_count += 1
+            print(f"Linear code matcher mismatch on corpus item {i}", file=sys.stderr)
+            print(repr(text), file=sys.stderr)
+
+    print(f"Checked {n} texts against {len(extraction_engines)} engines: {mismatch_count} mismatches")
+    print(f"Prefilter hit rate: {prefilter_statistics.hit_rate():.1%}")
+    if mismatch_count:
+        sys.exit(1)
+
+def run_invoke(n: int, seed: int) -> None:
+    invoke(n, seed)
@@ -1,3 +1,4 @@
+from typing import Optional
 
 import asyncio
 from configparser import ConfigParser
@@ -5,10 +6,10 @@ from configparser import ConfigParser
 import redditwarp.SYNC
 from redditwarp.models.submission_SYNC import TextPost
 
-from ..feature_extraction import extract_features
+from ..feature_extraction import extract_features_many
 from ..message_building import get_message_determiner
 
-async def invoke(n: int) -> None:
+async def invoke(n: int, workers: Optional[int] = None) -> None:
     config = ConfigParser()
     config.read('powershell_bot.ini')
     section = config[config.default_section]
@@ -17,13 +18,11 @@ async def invoke(n: int) -> None:
     client = redditwarp.SYNC.Client.from_praw_config(username)
 
     it = client.p.subreddit.pull.new('PowerShell', amount=n)
-    for subm in it:
-        if not isinstance(subm, TextPost):
-            continue
-
-        b = extract_features(subm.body)
+    submissions = [subm for subm in it if isinstance(subm, TextPost)]
+    feature_flags_iter = extract_features_many((subm.body for subm in submissions), workers=workers)
+    for subm, b in zip(submissions, feature_flags_iter):
         det = get_message_determiner(b)
         print(f"https://old.reddit.com/comments/{subm.id36} :: {det}")
 
-def run_invoke(n: int) -> None:
-    asyncio.run(invoke(n))
+def run_invoke(n: int, workers: Optional[int] = None) -> None:
+    asyncio.run(invoke(n, workers))
@@ -0,0 +1,112 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from typing import Awaitable
+
+import sys
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import event, insert
+
+from ..database_engine import create_engine
+from ..database_schema import create_database_async, record_table, record_archive_table
+from ..dal.service import Service
+from ..dal.work_queue import WorkQueue
+
+# The index each query must use, by a description of the query.
+expected_indexes = {
+    'record lookup by submission': 'record_target_submission_id_idx',
+    'archived record lookup by submission': 'record_archive_target_submission_id_idx',
+    'recheck page': 'record_rechecking_idx',
+    'due recheck page': 'record_rechecking_idx',
+    'work queue dequeue': 'work_item_dequeue_idx',
+}
+
+async def capture_statements(engine: Any, aw: Awaitable[Any]) -> list[tuple[str, Any]]:
+    """Run `aw` and return the SELECT statements it executed, with their parameters."""
+    statements: list[tuple[str, Any]] = []
+
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        await aw
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+async def explain(engine: Any, statement: str, parameters: Any) -> str:
+    async with engine.connect() as conn:
+        cursor = await conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(str(row[-1]) for row in cursor.all())
+
+async def invoke(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite+aiosqlite:///{Path(tmp_dir, 'test_query_plans.db')}")
+        try:
+            await create_database_async(engine)
+            now_ut = int(time.time())
+            rows = [
+                {
+                    'feature_flags': 0,
+                    # Most records are no longer rechecked, as in a live database.
+                    'recheck': i % 10 == 0,
+                    'target_submission_id': i,
+                    'target_submission_created_ut': now_ut - n + i,
+                    'target_submission_author_name': 'a',
+                    'next_recheck_ut': now_ut + i % 100,
+                }
+                for i in range(n)
+            ]
+            async with engine.begin() as conn:
+                await conn.execute(insert(record_table), rows)
+                await conn.execute(insert(record_archive_table), [{'id': n + i, **row, 'target_submission_id': n + i} for i, row in enumerate(rows)])
+
+            haven: set[asyncio.Task[None]] = set()
+            service = Service(engine=engine, haven=haven)
+            work_queue = WorkQueue(engine=engine, name='test')
+            for i in range(100):
+                await work_queue.try_enqueue(i)
+
+            async def read_pages(**kwargs: Any) -> None:
+                async for _record in service.produce_rechecking_records(page_size=10, **kwargs):
+                    pass
+
+            queries: dict[str, list[tuple[str, Any]]] = {
+                'record lookup by submission': await capture_statements(engine, service.get_record_by_submission_id(n // 2)),
+                'archived record lookup by submission': (await capture_statements(engine, service.get_record_by_submission_id(n + n // 2)))[1:],
+                'recheck page': await capture_statements(engine, read_pages()),
+                'due recheck page': await capture_statements(engine, read_pages(due_ut=now_ut + 50)),
+                'work queue dequeue': await capture_statements(engine, work_queue.dequeue()),
+            }
+
+            failure_count = 0
+            for name, statements in queries.items():
+                index_name = expected_indexes[name]
+                # Both the first page and a keyset page of a paged query are checked.
+                for statement, parameters in statements[:2]:
+                    plan = await explain(engine, statement, parameters)
+                    if index_name in plan:
+                        print(f"ok: {name} uses {index_name}")
+                    else:
+                        failure_count += 1
+                        print(f"FAIL: {name} doesn't use {index_name}")
+                        print(statement, file=sys.stderr)
+                        print(plan, file=sys.stderr)
+                if not statements:
+                    failure_count += 1
+                    print(f"FAIL: {name} executed no query")
+        finally:
+            await engine.dispose()
+
+    print(f"Checked {len(queries)} queries on {n} records: {failure_count} failures")
+    if failure_count:
+        sys.exit(1)
+
+def run_invoke(n: int) -> None:
+    asyncio.run(invoke(n))
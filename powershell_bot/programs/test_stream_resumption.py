@@ -0,0 +1,199 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Optional, Callable
+if TYPE_CHECKING:
+    from typing import Generator
+
+import sys
+import asyncio
+import logging
+import tempfile
+import time
+import types
+from contextlib import suppress
+from pathlib import Path
+
+from redditwarp.streaming.stream_ASYNC import StreamEventDispatcher
+
+from ..database_engine import create_engine
+from ..database_schema import create_database_async
+from ..dal.stream_checkpoint import StreamCheckpoint
+from ..programs.bot.api_budget import ApiBudgetScheduler, ApiPriority
+from ..programs.bot.stream_resumption import run_resumable_stream
+
+
+class Item:
+    def __init__(self, fullname: str, created_ut: int) -> None:
+        self.fullname = fullname
+        self.created_ut = created_ut
+
+
+class FakeStream:
+    """A stream that is live straight away and outputs the given items once."""
+
+    def __init__(self, live_items: list[Item]) -> None:
+        self.output: StreamEventDispatcher[Any] = StreamEventDispatcher()
+        self.error: StreamEventDispatcher[Exception] = StreamEventDispatcher()
+        self.live_items = live_items
+
+    async def __anext__(self) -> float:
+        return 0
+
+    def __await__(self) -> Generator[Any, None, None]:
+        return self._run().__await__()
+
+    async def _run(self) -> None:
+        for item in self.live_items:
+            await self.output(item)
+        await asyncio.Event().wait()
+
+
+class FakePaginator:
+    """A newest-first listing. Each fetch waits for `ready` and fails while `failures` remain."""
+
+    def __init__(self, items: list[Item]) -> None:
+        self.limit: Optional[int] = None
+        self.items = sorted(items, key=lambda item: item.created_ut, reverse=True)
+        self.ready = asyncio.Event()
+        self.ready.set()
+        self.failures = 0
+        self._offset = 0
+
+    async def fetch(self) -> list[Item]:
+        await self.ready.wait()
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('fetch failed')
+        assert self.limit is not None
+        page = self.items[self._offset:self._offset + self.limit]
+        self._offset += len(page)
+        return page
+
+
+class Run:
+    """One run of the bot's stream: the items it handled and its task."""
+
+    def __init__(self,
+        engine: Any,
+        *,
+        live_items: list[Item],
+        listing: list[Item],
+        stall: Callable[[Item], bool] = lambda item: False,
+    ) -> None:
+        self.checkpoint = StreamCheckpoint(engine=engine, name='test')
+        self.stream = FakeStream(live_items)
+        self.paginator = FakePaginator(listing)
+        self.handled: list[str] = []
+        self.stall = stall
+        self.stream.output.attach(self.handle)
+        self.task: Optional[asyncio.Task[None]] = None
+
+    async def handle(self, item: Item) -> None:
+        if not self.checkpoint.begin(item.fullname, item.created_ut):
+            return
+        if self.stall(item):
+            # Never completes, as if the bot stopped while handling it.
+            return
+        self.handled.append(item.fullname)
+        self.checkpoint.complete(item.fullname)
+
+    def start(self) -> None:
+        client: Any = types.SimpleNamespace(http=types.SimpleNamespace(last=types.SimpleNamespace(response=None)))
+        self.task = asyncio.create_task(run_resumable_stream(
+            self.stream,  # type: ignore[arg-type]
+            checkpoint=self.checkpoint,
+            catch_up_paginator=self.paginator,  # type: ignore[arg-type]
+            get_created_ut=lambda item: item.created_ut,
+            logger=logging.getLogger(__name__),
+            api_budget=ApiBudgetScheduler(client, rate=1000., burst=1000.),
+            priority=ApiPriority.NEW_SUBMISSION_REPLY,
+            checkpoint_interval=0,
+            catch_up_retry_delay=.1,
+        ))
+
+    async def stop(self) -> None:
+        assert self.task is not None
+        self.task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.task
+
+
+async def load_saved(engine: Any) -> Optional[str]:
+    checkpoint = StreamCheckpoint(engine=engine, name='test')
+    await checkpoint.load()
+    return checkpoint.last_seen_fullname
+
+async def settle() -> None:
+    await asyncio.sleep(.3)
+
+async def invoke() -> None:
+    failure_count = 0
+
+    def check(description: str, ok: bool) -> None:
+        nonlocal failure_count
+        print(f"{'ok' if ok else 'FAIL'}: {description}")
+        if not ok:
+            failure_count += 1
+
+    now_ut = int(time.time())
+    first = Item('t3_first', now_ut - 100)
+    missed = [Item(f't3_missed{i}', now_ut - 90 + i) for i in range(5)]
+    live = Item('t3_live', now_ut)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite+aiosqlite:///{Path(tmp_dir, 'test_stream_resumption.db')}")
+        try:
+            await create_database_async(engine)
+
+            run = Run(engine, live_items=[first], listing=[])
+            run.start()
+            await settle()
+            await run.stop()
+            check('the first run saves its position', await load_saved(engine) == first.fullname)
+
+            # A live item completes while the catch-up is still fetching.
+            run = Run(engine, live_items=[live], listing=[first, *missed, live])
+            run.paginator.ready.clear()
+            run.paginator.failures = 1
+            run.start()
+            await settle()
+            check('the live item is handled during the catch-up', run.handled == [live.fullname])
+            check('the saved position stays put during the catch-up', await load_saved(engine) == first.fullname)
+
+            # The bot stops before the catch-up is done.
+            await run.stop()
+            check('the saved position stays put when stopping during the catch-up', await load_saved(engine) == first.fullname)
+
+            # The next run catches up on the missed items (after a failed fetch)
+            # but not on the live item, which was handled already.
+            run = Run(engine, live_items=[], listing=[first, *missed, live])
+            run.paginator.failures = 1
+            run.start()
+            await settle()
+            check('the missed items are handled, oldest first, once the fetch succeeds', run.handled == [item.fullname for item in missed])
+            check('the position moves to the newest item after the catch-up', await load_saved(engine) == live.fullname)
+            await run.stop()
+
+            # An item is still being handled when the bot stops, so the position
+            # can't move past it, but a newer item has completed.
+            stalled = Item('t3_stalled', now_ut + 10)
+            newer = Item('t3_newer', now_ut + 20)
+            run = Run(engine, live_items=[stalled, newer], listing=[], stall=lambda item: item is stalled)
+            run.start()
+            await settle()
+            await run.stop()
+            check('the position stays behind an item still being handled', await load_saved(engine) == live.fullname)
+
+            run = Run(engine, live_items=[], listing=[live, stalled, newer])
+            run.start()
+            await settle()
+            check('after a restart, only the unfinished item is handled again', run.handled == [stalled.fullname])
+            await run.stop()
+        finally:
+            await engine.dispose()
+
+    print(f"{failure_count} failures")
+    if failure_count:
+        sys.exit(1)
+
+def run_invoke() -> None:
+    asyncio.run(invoke())
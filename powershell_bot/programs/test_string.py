@@ -1,17 +1,16 @@
 
-import asyncio
 from configparser import ConfigParser
 
-from ..feature_extraction import extract_features
+from ..feature_extraction import extraction_engines
 from ..message_building import get_message_determiner, build_message
 
-async def invoke(text: str) -> None:
+def invoke(text: str, engine_name: str = 'registry') -> None:
     config = ConfigParser()
     config.read('powershell_bot.ini')
     section = config[config.default_section]
     username = section['username']
 
-    b = extract_features(text)
+    b = extraction_engines[engine_name](text)
     det = get_message_determiner(b)
 
     print(b)
@@ -29,5 +28,5 @@ async def invoke(text: str) -> None:
         print()
         print(msg)
 
-def run_invoke(text: str) -> None:
-    asyncio.run(invoke(text))
+def run_invoke(text: str, engine_name: str = 'registry') -> None:
+    invoke(text, engine_name)